@@ -0,0 +1,407 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from detection import TRACK_DTYPE, box_tuple, to_json
+from recognition import crop_box
+
+
+class SamplingScheduler:
+    """Enforce a declarative per-stage sampling policy (frames per second)
+
+    `scale(stage)` lets the QoS controller and the inference budget slow
+    stages down without touching the policy itself.
+    """
+
+    def __init__(self, policy, scale=None, window=5.0):
+        self.policy = dict(policy)
+        self.scale = scale or (lambda stage: 1.0)
+        self.window = window
+        self._next_due = {stage: 0.0 for stage in self.policy}
+        self._runs = {stage: 0 for stage in self.policy}
+        self._seconds = {stage: 0.0 for stage in self.policy}
+        self._recent = {stage: deque() for stage in self.policy}
+        self._lock = threading.Lock()
+
+    def fps(self, stage):
+        return self.policy.get(stage, 0) * self.scale(stage)
+
+    def interval(self, stage):
+        fps = self.fps(stage)
+        return 1.0 / fps if fps > 0 else None
+
+    def pending(self, stage, now=None):
+        """True if due() would accept a frame now, without booking the slot"""
+        interval = self.interval(stage)
+        if interval is None:
+            return False
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return now >= self._next_due[stage]
+
+    def due(self, stage, now=None):
+        """True if the stage should see a frame now; books the slot if so"""
+        interval = self.interval(stage)
+        if interval is None:
+            return False
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            next_due = self._next_due[stage]
+            if now < next_due:
+                return False
+            # Keep the average rate exact, but don't burst to catch up after a stall
+            next_due += interval
+            self._next_due[stage] = next_due if next_due > now - interval else now + interval
+            return True
+
+    def record(self, stage, seconds, now=None):
+        """Book the cost of one stage run"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._runs[stage] += 1
+            self._seconds[stage] += seconds
+            recent = self._recent[stage]
+            recent.append(now)
+            while recent and now - recent[0] > self.window:
+                recent.popleft()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            stages = {}
+            for stage in self.policy:
+                recent = [t for t in self._recent[stage] if now - t <= self.window]
+                runs = self._runs[stage]
+                stages[stage] = {
+                    'policyFps': self.policy[stage],
+                    'targetFps': round(self.fps(stage), 2),
+                    'effectiveFps': round(len(recent) / self.window, 2),
+                    'runs': runs,
+                    'meanMs': round(self._seconds[stage] / runs * 1000, 2) if runs else None,
+                }
+            return stages
+
+
+class AnalyticsPipeline:
+    """Run motion gate, face detection and target matching on sampled frames
+
+    One thread per camera pulls frames from the hub; the scheduler decides
+    which stages see each one. Detection only runs while the motion gate is
+    open or faces are being tracked.
+    """
+
+    def __init__(self, camera_id, frame_hub, supervisor, scheduler, change_detector, detector,
+                 tracker, matcher, tiler=None, detection_cache=None, recognition=None,
+                 best_shots=None, budget=None, motion_hold=2.0, feeds=('live', 'manipulated')):
+        self.camera_id = camera_id
+        self.frame_hub = frame_hub
+        self.supervisor = supervisor
+        self.scheduler = scheduler
+        self.change_detector = change_detector
+        self.detector = detector
+        self.tiler = tiler
+        self.detection_cache = detection_cache
+        self.tracker = tracker
+        self.matcher = matcher
+        self.recognition = recognition
+        self.best_shots = best_shots
+        self.budget = budget
+        self.motion_hold = motion_hold
+        self.feeds = feeds
+
+        self.last_motion = 0.0
+        self._motion_thumb = None
+        self._motion_mask = None
+        # TRACK_DTYPE rows; scores, shots and cache entries key on the track id
+        self._tracked = np.empty(0, dtype=TRACK_DTYPE)
+        self._scores = {}
+        self._detected_frame = 0
+        # (tracks, target track, target score, is match, detection frame id)
+        # swapped as one tuple
+        self._state = (self._tracked, None, 0.0, False, 0)
+        # Per-feed JSON of the current state, shared by every stream viewer
+        self._annotations = (self._state, {})
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'{self.camera_id}-analytics',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def results(self):
+        """Return (detections, target) in the dashboard's JSON shape"""
+        tracks, target_track, target_score, is_match, _ = self._state
+        detections = to_json(tracks, self.tracker.prefix, self.feeds,
+                             target_track if is_match else None)
+
+        target = None
+        if target_track is not None:
+            target = {'detectionId': self.tracker.label(target_track),
+                      'confidence': target_score, 'isMatch': is_match}
+        return detections, target
+
+    def annotations(self, feed):
+        """Detections of one feed with the frame id they were computed on"""
+        state, by_feed = self._annotations
+        if state is not self._state:
+            state, by_feed = self._state, {}
+            self._annotations = (state, by_feed)
+
+        cached = by_feed.get(feed)
+        if cached is None:
+            tracks, target_track, _, is_match, frame_id = state
+            cached = {
+                'detectionSeq': frame_id,
+                'detections': to_json(tracks, self.tracker.prefix, (feed,),
+                                      target_track if is_match else None),
+            }
+            by_feed[feed] = cached
+        return cached
+
+    def target_shot(self):
+        """(track, best shot) of the current target, or (None, None)"""
+        _, target_track, _, is_match, _ = self._state
+        if not is_match or self.best_shots is None:
+            return None, None
+        return target_track, self.best_shots.best(target_track)
+
+    def _run(self):
+        self.supervisor.subscribe()
+        last_id = 0
+        try:
+            while not self._stop.is_set():
+                # Leased, so the capture cannot decode into it mid-detection
+                latest = self.frame_hub.next_frame(last_id, decode=False, lease=True)
+                if latest is None:
+                    continue
+                last_id, frame, _ = latest
+                try:
+                    if frame is None:
+                        # Passthrough frames are only decoded when a stage is due
+                        if not self.needs_pixels():
+                            continue
+                        frame = self.frame_hub.decode(last_id)
+                        if frame is None:
+                            continue
+                    self.process(last_id, frame)
+                except Exception as e:
+                    print(f"Error in analytics: {e}")
+                finally:
+                    self.frame_hub.release(latest[1])
+        finally:
+            self.supervisor.unsubscribe()
+
+    def needs_pixels(self, now=None):
+        """True if process() would look at the frame's pixels now"""
+        now = time.monotonic() if now is None else now
+        if self.scheduler.pending('motion', now):
+            return True
+        gate_open = now - self.last_motion < self.motion_hold or len(self._tracked) > 0
+        if gate_open and self.scheduler.pending('detection', now):
+            return True
+        return (len(self._tracked) > 0 and self.matcher is not None
+                and self.scheduler.pending('matching', now))
+
+    def process(self, frame_id, frame, now=None):
+        now = time.monotonic() if now is None else now
+
+        if self.scheduler.due('motion', now):
+            started = time.monotonic()
+            thumb = self.change_detector.thumbnail(frame_id, frame)
+            moved = self.change_detector.moved(self._motion_thumb, thumb)
+            if self.change_detector.significant(moved):
+                self.last_motion = now
+                self._motion_mask = moved
+            self._motion_thumb = thumb
+            self.scheduler.record('motion', time.monotonic() - started, now)
+
+        gate_open = now - self.last_motion < self.motion_hold or len(self._tracked) > 0
+
+        if gate_open and self.scheduler.due('detection', now):
+            started = time.monotonic()
+            boxes = self._detect(frame_id, frame, now)
+            self._tracked = self.tracker.update(boxes, now)
+            self._detected_frame = frame_id
+            live_ids = set(self._tracked['track'].tolist())
+            self._scores = {k: v for k, v in self._scores.items() if k in live_ids}
+            if self.recognition is not None:
+                self.recognition.retain(live_ids)
+            if self.best_shots is not None:
+                self.best_shots.retain(live_ids)
+                for row in self._tracked:
+                    self.best_shots.offer(int(row['track']), frame, frame_id, box_tuple(row), now)
+            self.scheduler.record('detection', time.monotonic() - started, now)
+            self._publish()
+
+        if len(self._tracked) and self.matcher is not None and self.scheduler.due('matching', now):
+            started = time.monotonic()
+            for row in self._tracked:
+                detection_id, box, quality = int(row['track']), box_tuple(row), None
+                if self.best_shots is not None:
+                    # Only the best crop seen so far goes to recognition
+                    shot = self.best_shots.best(detection_id)
+                    if shot is None:
+                        continue
+                    face, box, quality = shot['face'], shot['box'], shot['quality']
+                else:
+                    face = crop_box(frame, box)
+                if face is None:
+                    continue
+                if self.recognition is not None:
+                    self._scores[detection_id] = self.recognition.score(detection_id, box, face,
+                                                                        quality=quality, now=now)
+                else:
+                    self._scores[detection_id] = self.matcher.score(face)
+            self.scheduler.record('matching', time.monotonic() - started, now)
+            self._publish()
+
+        if self.budget is not None:
+            active = []
+            if gate_open:
+                active.append('detection')
+            if len(self._tracked) and self.matcher is not None:
+                active.append('matching')
+            self.budget.report(self.camera_id, motion=gate_open, target=self._state[3],
+                               active=active)
+
+    def _detect(self, frame_id, frame, now):
+        # Looping video files replay detections from earlier passes
+        position = None
+        if self.detection_cache is not None:
+            position = self.frame_hub.position(frame_id)
+            if position is not None:
+                boxes = self.detection_cache.get(position)
+                if boxes is not None:
+                    return boxes
+
+        if self.tiler is not None:
+            # Full-resolution tiles only where something moved or was tracked
+            motion_mask = self._motion_mask if now - self.last_motion < self.motion_hold else None
+            boxes = self.tiler.detect(frame, motion_mask, self._tracked)
+        else:
+            boxes = self.detector.detect(frame)
+
+        if position is not None:
+            self.detection_cache.put(position, boxes)
+        return boxes
+
+    def _publish(self):
+        target_id = None
+        target_score = 0.0
+        for detection_id, score in self._scores.items():
+            if score > target_score:
+                target_id, target_score = detection_id, score
+
+        is_match = self.matcher is not None and target_score >= self.matcher.threshold
+        self._state = (self._tracked, target_id, target_score, is_match, self._detected_frame)
+
+
+class InferenceBudget:
+    """Share a global analytics fps budget between cameras by priority
+
+    Every camera first gets its minimum guarantee (capped by its own
+    demand), then the rest of the budget is water-filled by priority
+    weight. Stages without a budget are not limited. A camera demands
+    nothing for a stage it reported as inactive (e.g. detection while its
+    motion gate is closed), so the budget goes where it is used.
+    """
+
+    PRIORITY_WEIGHTS = {'idle': 1.0, 'motion': 2.0, 'target': 4.0}
+
+    def __init__(self, budgets, minimums, weights=None, refresh=0.25):
+        self.budgets = dict(budgets)
+        self.minimums = dict(minimums)
+        self.weights = weights or self.PRIORITY_WEIGHTS
+        self.refresh = refresh
+        self._demand = {}
+        self._priority = {}
+        self._active = {}
+        self._allocation = {}
+        self._allocated_at = 0.0
+        self._lock = threading.Lock()
+
+    def register(self, camera_id, demand):
+        """demand(stage) returns the fps the camera would run without a budget"""
+        with self._lock:
+            self._demand[camera_id] = demand
+            self._priority[camera_id] = 'idle'
+            self._active[camera_id] = frozenset()
+            self._allocated_at = 0.0
+
+    def report(self, camera_id, motion=False, target=False, active=()):
+        """Priority inputs and the budgeted stages the camera runs right now"""
+        priority = 'target' if target else 'motion' if motion else 'idle'
+        active = frozenset(active)
+        if self._priority.get(camera_id) != priority or self._active.get(camera_id) != active:
+            with self._lock:
+                self._priority[camera_id] = priority
+                self._active[camera_id] = active
+                self._allocated_at = 0.0
+
+    def scale(self, camera_id, stage):
+        """Fraction of its demanded rate the camera may run a stage at"""
+        if stage not in self.budgets:
+            return 1.0
+
+        allocation = self._current()
+        demand = self._demand[camera_id](stage)
+        if demand <= 0:
+            return 1.0
+        return min(1.0, allocation[stage].get(camera_id, demand) / demand)
+
+    def snapshot(self):
+        allocation = self._current()
+        with self._lock:
+            return {
+                camera_id: {
+                    'priority': self._priority[camera_id],
+                    'activeStages': sorted(self._active[camera_id]),
+                    'allocatedFps': {
+                        stage: round(allocation[stage].get(camera_id, 0.0), 2)
+                        for stage in self.budgets
+                    },
+                }
+                for camera_id in self._demand
+            }
+
+    def _current(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._allocated_at >= self.refresh:
+                self._allocation = {stage: self._allocate(stage) for stage in self.budgets}
+                self._allocated_at = now
+            return self._allocation
+
+    def _allocate(self, stage):
+        demand = {
+            camera_id: max(0.0, fn(stage)) if stage in self._active[camera_id] else 0.0
+            for camera_id, fn in self._demand.items()
+        }
+        floor = self.minimums.get(stage, 0.0)
+        allocation = {camera_id: min(d, floor) for camera_id, d in demand.items()}
+        remaining = self.budgets[stage] - sum(allocation.values())
+
+        hungry = {camera_id for camera_id in demand if demand[camera_id] > allocation[camera_id]}
+        while remaining > 1e-6 and hungry:
+            total_weight = sum(self.weights[self._priority[c]] for c in hungry)
+            spent = 0.0
+            for camera_id in list(hungry):
+                share = remaining * self.weights[self._priority[camera_id]] / total_weight
+                given = min(share, demand[camera_id] - allocation[camera_id])
+                allocation[camera_id] += given
+                spent += given
+                if allocation[camera_id] >= demand[camera_id] - 1e-9:
+                    hungry.discard(camera_id)
+            remaining -= spent
+            if spent <= 1e-9:
+                break
+
+        return allocation
@@ -0,0 +1,267 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from detection import DetectionTracker, FaceDetector, to_json
+
+
+def keyframe_indexes(path, fps):
+    """Frame indexes of the video's keyframes via ffprobe, or None if unavailable"""
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None or not fps:
+        return None
+
+    try:
+        output = subprocess.run(
+            [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey',
+             '-show_entries', 'frame=pts_time', '-of', 'csv=p=0', path],
+            capture_output=True, text=True, timeout=300, check=True,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    indexes = set()
+    for line in output.splitlines():
+        try:
+            indexes.add(int(round(float(line.strip().rstrip(',')) * fps)))
+        except ValueError:
+            continue
+    return sorted(indexes) or None
+
+
+def count_frames(path):
+    """Count a video's frames when the container does not say (raw MJPEG)
+
+    Uses ffprobe's packet count if available, else grabs every frame
+    without decoding it.
+    """
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is not None:
+        try:
+            output = subprocess.run(
+                [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+                 '-show_entries', 'stream=nb_read_packets', '-of', 'csv=p=0', path],
+                capture_output=True, text=True, timeout=300, check=True,
+            ).stdout
+            return int(output.strip().rstrip(','))
+        except (OSError, subprocess.SubprocessError, ValueError):
+            pass
+
+    capture = cv2.VideoCapture(path)
+    count = 0
+    try:
+        while capture.grab():
+            count += 1
+    finally:
+        capture.release()
+    return count
+
+
+def plan_shards(frame_count, shards, keyframes=None):
+    """Split [0, frame_count) into about `shards` ranges starting on keyframes
+
+    Without keyframe information the ranges are even; seeking then decodes
+    from the previous keyframe, which costs time but stays frame accurate.
+    MJPEG has no inter frames, so every frame is a keyframe anyway.
+    """
+    shards = max(1, min(shards, frame_count))
+    ideal = [frame_count * i // shards for i in range(1, shards)]
+
+    if keyframes:
+        keys = np.array(keyframes)
+        ideal = [int(keys[np.abs(keys - point).argmin()]) for point in ideal]
+
+    bounds = sorted({0, frame_count, *[b for b in ideal if 0 < b < frame_count]})
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def detect_shard(path, start, stop, stride, detector_options):
+    """Run face detection over frames [start, stop) of a file (in a worker process)
+
+    Returns (start, stop, [(frame_index, BOX_DTYPE rows)]).
+    """
+    # One OpenCV thread per worker, the pool already uses every core
+    cv2.setNumThreads(1)
+    detector = FaceDetector(**detector_options)
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open '{path}'")
+
+    results = []
+    try:
+        if start:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for index in range(start, stop):
+            # Skipped frames are only grabbed, not decoded. The grid is
+            # anchored at frame 0, so sampling does not depend on the shards
+            if index % stride:
+                if not capture.grab():
+                    break
+                continue
+            success, frame = capture.read()
+            if not success:
+                break
+            results.append((index, detector.detect(frame)))
+    finally:
+        capture.release()
+
+    return start, stop, results
+
+
+class BatchJobs:
+    """Offline face detection over archived video files in a process pool
+
+    Each job splits its file into frame ranges on keyframe boundaries and
+    runs the shards in parallel; results are merged, tracked and kept in
+    memory until `history` newer jobs have been submitted.
+    """
+
+    def __init__(self, workers=None, shards_per_worker=2, detector_options=None, history=50):
+        self.workers = workers or os.cpu_count() or 1
+        self.shards_per_worker = shards_per_worker
+        self.detector_options = detector_options or {}
+        self.history = history
+        self._jobs = OrderedDict()
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Never fork the server process, it runs capture threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._pool
+
+    def submit(self, path, sample_fps=None):
+        """Queue a file for analysis and return its job id"""
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'jobId': job_id,
+            'path': path,
+            'status': 'queued',
+            'error': None,
+            'submittedAt': datetime.now().isoformat(),
+            'startedAt': None,
+            'finishedAt': None,
+            'sampleFps': sample_fps,
+            'frameCount': None,
+            'fps': None,
+            'shards': {'total': 0, 'done': 0, 'keyframeAligned': False},
+            'framesAnalyzed': 0,
+            'throughputFps': None,
+        }
+
+        with self._lock:
+            self._jobs[job_id] = {'state': job, 'results': None}
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest]['state']['status'] in ('queued', 'running'):
+                    break
+                del self._jobs[oldest]
+
+        threading.Thread(target=self._run, args=(job_id,), name=f'job-{job_id}', daemon=True).start()
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None:
+                return None
+            return dict(entry['state'], shards=dict(entry['state']['shards']))
+
+    def results(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            return None if entry is None else entry['results']
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]['state']
+        path = job['path']
+
+        try:
+            capture = cv2.VideoCapture(path)
+            if not capture.isOpened():
+                raise RuntimeError(f"Could not open '{path}'")
+            fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+            frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            capture.release()
+            if frame_count <= 0:
+                # Raw MJPEG has no index, the reported count is 0 or garbage
+                frame_count = count_frames(path)
+            if frame_count <= 0:
+                raise RuntimeError(f"'{path}' reports no frames")
+
+            stride = max(1, int(round(fps / job['sampleFps']))) if job['sampleFps'] else 1
+            keyframes = keyframe_indexes(path, fps)
+            shards = plan_shards(frame_count, self.workers * self.shards_per_worker, keyframes)
+
+            job.update(status='running', startedAt=datetime.now().isoformat(),
+                       frameCount=frame_count, fps=fps)
+            job['shards'].update(total=len(shards), keyframeAligned=keyframes is not None)
+            started = time.monotonic()
+
+            pool = self._executor()
+            futures = [pool.submit(detect_shard, path, start, stop, stride, self.detector_options)
+                       for start, stop in shards]
+
+            frames = []
+            for future in as_completed(futures):
+                _, _, shard_frames = future.result()
+                frames.extend(shard_frames)
+                job['shards']['done'] += 1
+                job['framesAnalyzed'] += len(shard_frames)
+                job['throughputFps'] = round(
+                    job['framesAnalyzed'] * stride / (time.monotonic() - started), 1)
+
+            results = self._merge(job_id, frames, fps, stride)
+            with self._lock:
+                self._jobs[job_id]['results'] = results
+            job.update(status='done', finishedAt=datetime.now().isoformat())
+            print(f"✅ Job {job_id}: {len(frames)} frames of {path} analyzed "
+                  f"({job['throughputFps']} video frames/s)")
+        except Exception as e:
+            job.update(status='failed', error=str(e), finishedAt=datetime.now().isoformat())
+            print(f"Error in job {job_id}: {e}")
+
+    def _merge(self, job_id, frames, fps, stride):
+        """Order shard output by frame and give detections stable ids across shards"""
+        frames.sort(key=lambda item: item[0])
+        # A face may go unseen for a few sampled frames before its id is dropped
+        tracker = DetectionTracker(prefix='d-live', max_age=3 * stride / fps)
+
+        merged = []
+        for index, boxes in frames:
+            timestamp = index / fps
+            tracks = tracker.update(boxes, timestamp)
+            merged.append({
+                'frameIndex': index,
+                'timestampMs': int(timestamp * 1000),
+                'detections': to_json(tracks, tracker.prefix),
+            })
+
+        return {
+            'jobId': job_id,
+            'fps': fps,
+            'frames': merged,
+        }
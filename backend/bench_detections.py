@@ -0,0 +1,139 @@
+"""Per-frame post-processing overhead of detection results
+
+Compares the old per-box Python path (tuples, scalar IoU, dict-based
+tracker, per-field clamping) with the structured NumPy path (make_boxes,
+nms, DetectionTracker, to_json) on the same synthetic cascade output.
+
+    python bench_detections.py [boxes] [frames]
+"""
+import math
+import sys
+import time
+
+import numpy as np
+
+from detection import DetectionTracker, iou, make_boxes, level_weight_confidence, nms, to_json
+
+WIDTH, HEIGHT = 1280, 720
+NMS_IOU = 0.4
+
+
+def make_frames(boxes, frames):
+    """Raw (rects, weights) per frame, jittered so tracks have to be matched"""
+    rng = np.random.default_rng(0)
+    rects = np.column_stack([
+        rng.uniform(-20, WIDTH - 40, boxes),
+        rng.uniform(-20, HEIGHT - 40, boxes),
+        rng.uniform(24, 90, boxes),
+        rng.uniform(24, 90, boxes),
+    ])
+    weights = rng.uniform(0.5, 8.0, boxes)
+    return [(rects + rng.normal(0, 2, rects.shape), weights) for _ in range(frames)]
+
+
+class TupleTracker:
+    """The tracker as it was before structured arrays, for comparison"""
+
+    def __init__(self, prefix='d-live', iou_threshold=0.3, max_age=1.0):
+        self.prefix = prefix
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self._tracks = {}
+        self._next_id = 1
+
+    def update(self, boxes, now):
+        candidates = sorted(
+            ((iou(track['box'], box[:4]), track_id, index)
+             for track_id, track in self._tracks.items()
+             for index, box in enumerate(boxes)),
+            reverse=True,
+        )
+        assigned = {}
+        used_tracks = set()
+        for overlap, track_id, index in candidates:
+            if overlap < self.iou_threshold:
+                break
+            if track_id in used_tracks or index in assigned:
+                continue
+            assigned[index] = track_id
+            used_tracks.add(track_id)
+
+        results = []
+        for index, box in enumerate(boxes):
+            track_id = assigned.get(index)
+            if track_id is None:
+                track_id = f'{self.prefix}-{self._next_id}'
+                self._next_id += 1
+            self._tracks[track_id] = {'box': box[:4], 'seen': now}
+            results.append((track_id,) + tuple(box))
+
+        for track_id in [t for t, track in self._tracks.items() if now - track['seen'] > self.max_age]:
+            del self._tracks[track_id]
+        return results
+
+
+def run_tuples(frames):
+    tracker = TupleTracker()
+    for index, (rects, weights) in enumerate(frames):
+        boxes = []
+        for (x, y, w, h), weight in zip(rects.tolist(), weights.tolist()):
+            confidence = max(0.05, min(0.99, 1.0 - math.exp(-weight / 3.0)))
+            x0, y0 = max(0.0, min(1.0, x / WIDTH)), max(0.0, min(1.0, y / HEIGHT))
+            x1, y1 = max(0.0, min(1.0, (x + w) / WIDTH)), max(0.0, min(1.0, (y + h) / HEIGHT))
+            boxes.append((x0, y0, x1 - x0, y1 - y0, confidence))
+
+        # Greedy NMS with the scalar IoU
+        boxes.sort(key=lambda b: b[4], reverse=True)
+        kept = []
+        for box in boxes:
+            if all(iou(box, other) <= NMS_IOU for other in kept):
+                kept.append(box)
+
+        tracked = tracker.update(kept, index / 15)
+        [{
+            'id': track_id,
+            'feed': 'live',
+            'bbox': {'x': x, 'y': y, 'w': w, 'h': h},
+            'confidence': confidence,
+            'isTarget': False,
+        } for track_id, x, y, w, h, confidence in tracked]
+        yield
+
+
+def run_structured(frames):
+    tracker = DetectionTracker()
+    for index, (rects, weights) in enumerate(frames):
+        boxes = make_boxes(rects, level_weight_confidence(weights), WIDTH, HEIGHT)
+        boxes = boxes[nms(boxes, NMS_IOU)]
+        tracked = tracker.update(boxes, index / 15)
+        to_json(tracked, tracker.prefix)
+        yield
+
+
+def measure(name, runner, frames):
+    timings = []
+    started = time.perf_counter()
+    for _ in runner(frames):
+        now = time.perf_counter()
+        timings.append(now - started)
+        started = now
+
+    # Skip the first frames, where the tracker is still empty
+    steady = np.array(timings[len(timings) // 4:]) * 1000
+    print(f"{name:>10}: mean {steady.mean():7.3f} ms, p95 {np.percentile(steady, 95):7.3f} ms per frame")
+    return steady.mean()
+
+
+def main():
+    boxes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    frames = make_frames(boxes, count)
+
+    print(f"{boxes} boxes per frame, {count} frames")
+    baseline = measure('tuples', run_tuples, frames)
+    structured = measure('structured', run_structured, frames)
+    print(f"post-processing {baseline / structured:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Allocation benchmark for the frame pool and shared multipart framing
+
+Compares the old per-viewer pipeline (fresh frame array, tobytes() and two
+concatenations per viewer) with the pooled one, using tracemalloc to measure
+how many bytes each frame allocates on top of what was already live.
+
+    python bench_frame_pool.py [viewers] [frames]
+"""
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from framepool import FramePool
+from renditions import multipart_part
+
+WIDTH, HEIGHT = 1280, 720
+QUALITY = 85
+
+
+def make_source():
+    """A noisy synthetic 720p frame, so JPEG sizes are realistic"""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(frame, (9, 9), 0)
+
+
+def run_baseline(source, viewers, frames):
+    for _ in range(frames):
+        # cam.read() hands back a new array every time
+        frame = source.copy()
+        for _ in range(viewers):
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, QUALITY])
+            frame_bytes = buffer.tobytes()
+            chunk = (b'--frame\r\n'
+                     b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+            del chunk
+        yield
+
+
+def run_pooled(source, viewers, frames):
+    pool = FramePool(4)
+    published = None
+    for _ in range(frames):
+        # cam.read(out) decodes into a pooled array
+        frame = pool.acquire(source.shape)
+        np.copyto(frame, source)
+        published = frame
+        del frame
+
+        # Encoded and framed once, every viewer yields the same bytes
+        ret, buffer = cv2.imencode('.jpg', published, [cv2.IMWRITE_JPEG_QUALITY, QUALITY])
+        part = multipart_part(buffer)
+        for _ in range(viewers):
+            chunk = part
+            del chunk
+        yield
+    print(f"   pool: allocated={pool.allocated} reused={pool.reused}")
+
+
+def measure(name, runner, source, viewers, frames):
+    tracemalloc.start()
+    transient = []
+    previous = 0
+    started = time.perf_counter()
+
+    # Peak above what was live at the end of the previous frame is what
+    # this frame had to allocate
+    for _ in runner(source, viewers, frames):
+        current, peak = tracemalloc.get_traced_memory()
+        transient.append(peak - previous)
+        previous = current
+        tracemalloc.reset_peak()
+
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+
+    # The first frames warm up the pool, report the steady state
+    steady = transient[len(transient) // 4:]
+    per_frame = sum(steady) / len(steady)
+    print(f"{name:>9}: {per_frame / 1e6:8.2f} MB allocated per frame, "
+          f"{frames / elapsed:6.1f} frames/s")
+    return per_frame
+
+
+def main():
+    viewers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    source = make_source()
+
+    print(f"{WIDTH}x{HEIGHT} q{QUALITY}, {viewers} viewers, {frames} frames")
+    baseline = measure('baseline', run_baseline, source, viewers, frames)
+    pooled = measure('pooled', run_pooled, source, viewers, frames)
+    print(f"allocation per frame reduced by {100 * (1 - pooled / baseline):.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Bandwidth report for tile-diff streaming on recorded footage
+
+Encodes every frame of a video twice: as a full JPEG (what MJPEG and
+/api/ws/video send) and through TileDiffEncoder (what /api/ws/tiles
+sends), and prints the bytes each would put on the wire.
+
+    python bench_tile_diff.py [video] [frames] [height]
+"""
+import sys
+import time
+
+import cv2
+
+from renditions import scale_to_height
+from tilediff import TileDiffEncoder
+
+QUALITY = 85
+TILE_SIZE = 64
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'sample_video.mp4'
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 720
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"Could not open '{path}' (run ./download_sample_video.sh or pass a video)")
+        sys.exit(1)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    encoder = TileDiffEncoder(tile_size=TILE_SIZE, quality=QUALITY)
+    full_bytes = 0
+    tile_bytes = 0
+    messages = 0
+    tile_seconds = 0.0
+    count = 0
+
+    for index in range(frames):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame = scale_to_height(frame, height)
+        size = f'{frame.shape[1]}x{frame.shape[0]}'
+        count += 1
+
+        ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, QUALITY])
+        full_bytes += len(jpeg)
+
+        # Replay at the file's own pace, so keyframe intervals are realistic
+        started = time.perf_counter()
+        encoded = encoder.encode(frame, now=index / fps)
+        tile_seconds += time.perf_counter() - started
+        if encoded is not None:
+            tile_bytes += len(encoded[1])
+            messages += 1
+
+    cap.release()
+    if not count:
+        print("No frames read")
+        sys.exit(1)
+
+    seconds = count / fps
+    print(f"{path}: {count} frames at {size}, {fps:.1f} fps")
+    print(f"  full JPEG: {full_bytes / 1e6:8.2f} MB ({8 * full_bytes / seconds / 1e6:6.2f} Mbit/s)")
+    print(f"  tile diff: {tile_bytes / 1e6:8.2f} MB ({8 * tile_bytes / seconds / 1e6:6.2f} Mbit/s), "
+          f"{messages} messages, {encoder.keyframes} keyframes, "
+          f"{encoder.tiles_sent / max(1, encoder.tile_updates):.1f} tiles per update")
+    print(f"  bandwidth reduced by {100 * (1 - tile_bytes / full_bytes):.0f}%, "
+          f"tile-diff cost {1000 * tile_seconds / count:.2f} ms per frame")
+
+
+if __name__ == "__main__":
+    main()
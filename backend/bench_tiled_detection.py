@@ -0,0 +1,104 @@
+"""Recall/latency report for tiled face detection
+
+Runs every frame of a video through three detectors:
+
+- reference: the whole frame at native resolution (slow, used as ground truth)
+- frame:     the whole frame downscaled to the detector input width
+- tiled:     the downscaled pass plus native tiles where there is motion or
+             a tracked face, as the analytics pipeline runs it
+
+and prints recall against the reference next to per-frame latency.
+
+    python bench_tiled_detection.py [video] [frames]
+"""
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detection import DetectionTracker, FaceDetector, TiledDetector, pairwise_iou
+from motion import ChangeDetector
+
+MATCH_IOU = 0.3
+
+
+def recall(found, reference):
+    """Share of reference boxes matched by a found box"""
+    if not len(reference):
+        return None
+    if not len(found):
+        return 0.0
+    matched = (pairwise_iou(reference, found) >= MATCH_IOU).any(axis=1)
+    return float(matched.mean())
+
+
+def summarize(name, latencies, recalls):
+    latencies = np.array(latencies) * 1000
+    recalls = [r for r in recalls if r is not None]
+    mean_recall = f"{100 * sum(recalls) / len(recalls):5.1f}%" if recalls else "  n/a"
+    print(f"{name:>9}: recall {mean_recall}, "
+          f"mean {latencies.mean():7.1f} ms, p95 {np.percentile(latencies, 95):7.1f} ms")
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'sample_video.mp4'
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"Could not open '{path}' (run ./download_sample_video.sh or pass a video)")
+        sys.exit(1)
+
+    reference = FaceDetector(input_width=1 << 16)
+    whole = FaceDetector()
+    tiler = TiledDetector(FaceDetector())
+    tracker = DetectionTracker()
+    change_detector = ChangeDetector()
+
+    timings = {'reference': [], 'frame': [], 'tiled': []}
+    recalls = {'frame': [], 'tiled': []}
+    previous = None
+    tracked = None
+
+    for frame_id in range(1, frames + 1):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        height, width = frame.shape[:2]
+
+        thumb = change_detector.thumbnail(frame_id, frame)
+        moved = change_detector.moved(previous, thumb)
+        previous = thumb
+
+        started = time.perf_counter()
+        truth = reference.detect(frame)
+        timings['reference'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        found = whole.detect(frame)
+        timings['frame'].append(time.perf_counter() - started)
+        recalls['frame'].append(recall(found, truth))
+
+        started = time.perf_counter()
+        motion_mask = moved if change_detector.significant(moved) else None
+        found = tiler.detect(frame, motion_mask, tracked)
+        timings['tiled'].append(time.perf_counter() - started)
+        recalls['tiled'].append(recall(found, truth))
+        tracked = tracker.update(found)
+
+    cap.release()
+    if not timings['reference']:
+        print("No frames read")
+        sys.exit(1)
+
+    stats = tiler.snapshot()
+    print(f"{path}: {len(timings['reference'])} frames at {width}x{height}, "
+          f"{stats['meanActiveTiles']} of {stats['gridTiles']} tiles active on average")
+    summarize('reference', timings['reference'], [1.0])
+    summarize('frame', timings['frame'], recalls['frame'])
+    summarize('tiled', timings['tiled'], recalls['tiled'])
+
+
+if __name__ == "__main__":
+    main()
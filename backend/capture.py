@@ -0,0 +1,493 @@
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import cv2
+
+from waiters import AsyncWaiters
+
+
+# Immutable snapshot of what the capture reported when it was opened
+CaptureInfo = namedtuple('CaptureInfo', ['fps', 'width', 'height', 'codec'])
+
+
+def probe_capture(capture, frame):
+    """Read capture properties once; fall back to the frame's real size"""
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)) or frame.shape[1]
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)) or frame.shape[0]
+
+    fourcc = int(capture.get(cv2.CAP_PROP_FOURCC))
+    codec = "".join([chr((fourcc >> 8 * i) & 0xFF) for i in range(4)]).strip('\x00 ')
+
+    return CaptureInfo(fps=fps if fps > 0 else 0.0, width=width, height=height, codec=codec)
+
+
+def is_jpeg(data):
+    """True if a raw capture buffer holds a JPEG (starts with the SOI marker)"""
+    return data is not None and data.size > 2 and data.flat[0] == 0xFF and data.flat[1] == 0xD8
+
+
+class FrameHub:
+    """Share the newest camera frame between all consumers
+
+    Passthrough cameras publish the camera's JPEG without pixels. Those
+    frames are decoded at most once, and only when a consumer asks for
+    pixels; decode=False callers get frame=None and use jpeg() instead.
+
+    Threads wait with next_frame(), coroutines with wait_frame().
+
+    With a FramePool, the hub leases the frame it currently publishes, and
+    lease=True hands that lease on to the consumer under the same lock, so
+    the capture cannot decode into a frame anyone still reads. Every
+    leased frame must be given back with release().
+    """
+
+    POSITION_HISTORY = 64
+    JPEG_HISTORY = 4
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        # (frame_id, frame, captured_at) is swapped as one tuple so readers
+        # never see a mix; captured_at is on the time.monotonic() clock
+        self._latest = (0, None, 0.0)
+        self._cond = threading.Condition()
+        self._async_waiters = AsyncWaiters()
+        # frame_id -> frame index within a video file, for recent frames
+        self._positions = OrderedDict()
+        # frame_id -> compressed frame, for recent passthrough frames
+        self._jpegs = OrderedDict()
+        self._decoded = (0, None)
+        self._decode_lock = threading.Lock()
+        self.decoded_frames = 0
+        # Newest passthrough frame that would not decode, waited past
+        self._undecodable = 0
+
+    def latest(self, decode=True, lease=False):
+        """Return (frame_id, frame, captured_at) of the most recent frame"""
+        latest = self._take(lease)
+        return self._with_pixels(latest) if decode else latest
+
+    def release(self, frame):
+        """Give back a frame leased from latest(), next_frame() or wait_frame()"""
+        if self.pool is not None and frame is not None:
+            self.pool.release(frame)
+
+    def _take(self, lease):
+        with self._cond:
+            latest = self._latest
+            if lease and self.pool is not None and latest[1] is not None:
+                self.pool.lease(latest[1])
+            return latest
+
+    def publish(self, frame, captured_at, position=None, jpeg=None):
+        with self._cond:
+            frame_id = self._latest[0] + 1
+            if self.pool is not None:
+                # The hub's own lease moves to the new frame
+                if frame is not None:
+                    self.pool.lease(frame)
+                self.release(self._latest[1])
+            self._latest = (frame_id, frame, captured_at)
+            if position is not None:
+                self._positions[frame_id] = position
+                while len(self._positions) > self.POSITION_HISTORY:
+                    self._positions.popitem(last=False)
+            if jpeg is not None:
+                self._jpegs[frame_id] = jpeg
+                while len(self._jpegs) > self.JPEG_HISTORY:
+                    self._jpegs.popitem(last=False)
+            self._cond.notify_all()
+        self._async_waiters.notify_all()
+
+    def jpeg(self, frame_id):
+        """The camera's own JPEG of a recent passthrough frame, or None"""
+        return self._jpegs.get(frame_id)
+
+    def decode(self, frame_id):
+        """Pixels of a recent passthrough frame, decoded once and shared"""
+        with self._decode_lock:
+            if self._decoded[0] == frame_id:
+                return self._decoded[1]
+            jpeg = self._jpegs.get(frame_id)
+            if jpeg is None:
+                return None
+            frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+            if frame is None:
+                return None
+            self._decoded = (frame_id, frame)
+            self.decoded_frames += 1
+            return frame
+
+    def _with_pixels(self, latest):
+        if latest[1] is not None or latest[0] == 0:
+            return latest
+        return (latest[0], self.decode(latest[0]), latest[2])
+
+    def position(self, frame_id):
+        """Frame index within the source file, or None for live or old frames"""
+        return self._positions.get(frame_id)
+
+    def next_frame(self, last_id, timeout=1.0, decode=True, lease=False):
+        """Wait for a frame newer than last_id
+
+        Returns None if no new frame arrived within the timeout. With
+        decode, a passthrough frame that would not decode is skipped and
+        the wait continues from it, so callers never spin on it.
+        """
+        floor = max(last_id, self._undecodable) if decode else last_id
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest[0] > floor, timeout):
+                return None
+        latest = self._take(lease)
+        return self._finish(latest) if decode else latest
+
+    async def wait_frame(self, last_id, timeout=1.0, decode=True, lease=False):
+        """next_frame() for coroutines: waits on the event loop, not in a worker thread
+
+        Only the decode of a passthrough frame runs in a worker thread.
+        """
+        floor = max(last_id, self._undecodable) if decode else last_id
+        if not await self._async_waiters.wait_for(lambda: self._latest[0] > floor, timeout):
+            return None
+        latest = self._take(lease)
+        if not decode or latest[1] is not None:
+            return latest
+        return await asyncio.to_thread(self._finish, latest)
+
+    def _finish(self, latest):
+        latest = self._with_pixels(latest)
+        if latest[1] is None:
+            with self._cond:
+                self._undecodable = max(self._undecodable, latest[0])
+            return None
+        return latest
+
+
+class CameraSupervisor:
+    """Own one capture source: connect with backoff, read frames, publish them
+
+    The supervisor thread is the only thread that ever touches the capture
+    handle. Everyone else sees published frames and the CaptureInfo snapshot.
+
+    In 'latest' mode (live sources only) the device buffer is drained with
+    grab() and only the newest frame is decoded with retrieve().
+
+    With passthrough (live sources only) the backend is asked for the
+    camera's undecoded frames. If they are JPEGs they are published as
+    they are and decoded only on demand; otherwise the supervisor
+    reconnects with normal decoding.
+
+    Consumers subscribe()/unsubscribe(). Once nobody has been subscribed for
+    idle_grace seconds, reading stops. The device is also released if it
+    last reopened within resume_latency seconds, otherwise it is kept open
+    so resuming stays within that bound.
+    """
+
+    # A read that returns faster than this came from the device buffer
+    BUFFERED_READ_SECONDS = 0.002
+
+    def __init__(self, open_capture, frame_hub, name='camera', loop=False, mode='buffered',
+                 max_drain=8, frame_pool=None, passthrough=False, idle_grace=10.0,
+                 resume_latency=1.0, base_delay=0.5, max_delay=30.0, jitter=0.25,
+                 failure_threshold=5):
+        self.open_capture = open_capture
+        self.frame_hub = frame_hub
+        self.frame_pool = frame_pool
+        self.name = name
+        self.loop = loop
+        # Draining would skip frames of a file, so only live sources use it
+        self.mode = 'buffered' if loop else mode
+        # File packets are not JPEGs, so only live sources pass through
+        self.passthrough = passthrough and not loop
+        self.passthrough_active = False
+        self.max_drain = max_drain
+        self.idle_grace = idle_grace
+        self.resume_latency = resume_latency
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.failure_threshold = failure_threshold
+
+        self.state = 'connecting'
+        self.attempts = 0
+        self.next_retry_in = 0.0
+        self.info = None
+        self.buffer_size_supported = None
+        self.drained_frames = 0
+        self.subscribers = 0
+        self.suspensions = 0
+        self.open_seconds = None
+        self._idle_since = time.monotonic()
+        self._frame_shape = None
+        # Set when the device must be reopened with decoding; not a failure
+        self._reopen = False
+        self._demand = threading.Event()
+        self._subscriber_lock = threading.Lock()
+        self._online = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-capture', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._demand.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def is_online(self):
+        return self._online.is_set()
+
+    def wait_online(self, timeout=None):
+        return self._online.wait(timeout)
+
+    def subscribe(self):
+        """Register a frame consumer, resuming capture if it was suspended"""
+        with self._subscriber_lock:
+            self.subscribers += 1
+            self._demand.set()
+
+    def unsubscribe(self):
+        with self._subscriber_lock:
+            self.subscribers = max(0, self.subscribers - 1)
+            if self.subscribers == 0:
+                self._idle_since = time.monotonic()
+                self._demand.clear()
+
+    def _idle_expired(self):
+        return (self.subscribers == 0
+                and time.monotonic() - self._idle_since >= self.idle_grace)
+
+    def _wait_for_demand(self):
+        """Block until a consumer subscribes (or the supervisor stops)"""
+        self.suspensions += 1
+        while not self._stop.is_set() and not self._demand.wait(timeout=1.0):
+            pass
+
+    def _connect(self):
+        """Open the capture, retrying with exponential backoff and jitter"""
+        delay = self.base_delay
+
+        while not self._stop.is_set():
+            self.attempts += 1
+
+            started = time.monotonic()
+            capture = None
+            try:
+                capture = self.open_capture()
+                if capture is not None and capture.isOpened():
+                    self.open_seconds = time.monotonic() - started
+                    if self.mode == 'latest':
+                        self.buffer_size_supported = bool(capture.set(cv2.CAP_PROP_BUFFERSIZE, 1))
+                    self.passthrough_active = self.passthrough and self._request_raw(capture)
+                    self.attempts = 0
+                    self.next_retry_in = 0.0
+                    return capture
+            except Exception as e:
+                print(f"Error opening {self.name}: {e}")
+
+            if capture is not None:
+                capture.release()
+
+            self._online.clear()
+            self.info = None
+            self.state = 'offline'
+            self.next_retry_in = delay * (1 + random.uniform(-self.jitter, self.jitter))
+            self._stop.wait(self.next_retry_in)
+            delay = min(delay * 2, self.max_delay)
+
+        return None
+
+    def _run(self):
+        # Consecutive connections that ended in an exception, for backoff
+        errors = 0
+
+        while not self._stop.is_set():
+            if self._idle_expired():
+                self._wait_for_demand()
+                continue
+
+            capture = self._connect()
+            if capture is None:
+                break
+
+            suspended = False
+            failed = False
+            try:
+                suspended = self._read_loop(capture)
+            except Exception as e:
+                # A backend or decode error ends this connection, not the thread
+                failed = True
+                self._reopen = False
+                print(f"Error reading {self.name}: {e}")
+            finally:
+                capture.release()
+
+            if self._reopen:
+                # Passthrough was refused by the camera itself, which is fine:
+                # open it again straight away, decoding this time
+                self._reopen = False
+                continue
+
+            if suspended:
+                # Device released while idle; info and online state are kept
+                # because the camera itself is fine
+                self.state = 'suspended'
+                self._wait_for_demand()
+                if not self._stop.is_set():
+                    self.state = 'resuming'
+                continue
+
+            self._online.clear()
+            self.info = None
+            if not self._stop.is_set():
+                self.state = 'reconnecting'
+                print(f"⚠️  {self.name}: capture lost, reconnecting")
+
+            errors = errors + 1 if failed else 0
+            if errors:
+                # The device opens fine but keeps failing: back off like _connect
+                delay = min(self.base_delay * 2 ** (errors - 1), self.max_delay)
+                self.next_retry_in = delay * (1 + random.uniform(-self.jitter, self.jitter))
+                self._stop.wait(self.next_retry_in)
+
+    def _request_raw(self, capture):
+        """Ask the backend for undecoded frames; True if it accepted"""
+        # V4L2 hands out the MJPEG buffer with RGB conversion off, FFmpeg
+        # returns demuxed packets with CAP_PROP_FORMAT -1
+        converted = capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        raw = capture.set(cv2.CAP_PROP_FORMAT, -1)
+        return bool(converted or raw)
+
+    def _decode(self, capture, method):
+        """Call read() or retrieve(), decoding into a pooled array when possible"""
+        if self.passthrough_active:
+            # Raw buffers change size every frame, the pool does not apply
+            return method()
+
+        if self.frame_pool is None or self._frame_shape is None:
+            success, frame = method()
+        else:
+            success, frame = method(self.frame_pool.acquire(self._frame_shape))
+
+        if success and frame.shape != self._frame_shape:
+            # OpenCV allocated a fresh array (first frame or new size)
+            self._frame_shape = frame.shape
+            if self.frame_pool is not None:
+                self.frame_pool.adopt(frame)
+        return success, frame
+
+    def _read(self, capture):
+        """Read one frame; returns (success, frame, waited_for_device)"""
+        started = time.monotonic()
+
+        if self.mode != 'latest':
+            success, frame = self._decode(capture, capture.read)
+            return success, frame, time.monotonic() - started > self.BUFFERED_READ_SECONDS
+
+        if not capture.grab():
+            return False, None, False
+        waited = time.monotonic() - started > self.BUFFERED_READ_SECONDS
+
+        # Keep grabbing while frames come straight out of the buffer; the
+        # first grab that has to wait on the device holds the newest frame
+        drained = 0
+        while not waited and drained < self.max_drain:
+            grab_started = time.monotonic()
+            if not capture.grab():
+                break
+            drained += 1
+            waited = time.monotonic() - grab_started > self.BUFFERED_READ_SECONDS
+
+        self.drained_frames += drained
+        success, frame = self._decode(capture, capture.retrieve)
+        return success, frame, waited
+
+    def _pause(self):
+        """Idle with the device still open; returns True to release it instead"""
+        if not self.loop and self.open_seconds is not None and self.open_seconds <= self.resume_latency:
+            return True
+
+        self.state = 'paused'
+        self._wait_for_demand()
+        self.state = 'online'
+        return False
+
+    def _read_loop(self, capture):
+        """Read and publish frames; returns True when suspended for idleness"""
+        failures = 0
+        first = True
+        # Index of the next frame within a video file
+        position = 0
+        interval = 0.0
+        frame_interval = 1.0 / 30
+        captured_at = 0.0
+
+        while not self._stop.is_set():
+            if self._idle_expired() and self._pause():
+                return True
+
+            started = time.monotonic()
+            success, frame, waited = self._read(capture)
+
+            if not success:
+                # Video files loop at the end instead of reconnecting
+                if self.loop and failures == 0:
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    position = 0
+                failures += 1
+                if failures >= self.failure_threshold:
+                    return False
+                self._stop.wait(0.1)
+                continue
+
+            failures = 0
+            jpeg = None
+            if self.passthrough_active:
+                if not is_jpeg(frame):
+                    print(f"⚙️  {self.name}: camera does not deliver JPEG, reopening with decoding")
+                    self.passthrough = False
+                    self.passthrough_active = False
+                    self._reopen = True
+                    return False
+                # Publish the camera's JPEG as is, pixels are decoded on demand
+                jpeg, frame = frame.reshape(-1), None
+
+            if first:
+                # Probed once per connection
+                first = False
+                if frame is None:
+                    decoded = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+                    if decoded is None:
+                        # Cannot size the stream from it; reconnect with backoff
+                        raise RuntimeError("first JPEG from the camera does not decode")
+                else:
+                    decoded = frame
+                self.info = probe_capture(capture, decoded)
+                frame_interval = 1.0 / (self.info.fps or 30)
+                # Files are read as fast as we ask, so pace them at their own fps
+                if self.loop:
+                    interval = frame_interval
+                self.state = 'online'
+                self._online.set()
+
+            # A frame that had to be waited for is fresh off the device. One
+            # that came out of the buffer was captured a frame interval after
+            # the previous one, which may be much earlier than now
+            now = time.monotonic()
+            if waited or self.loop or not captured_at:
+                captured_at = now
+            else:
+                captured_at = min(now, captured_at + frame_interval)
+
+            self.frame_hub.publish(frame, captured_at, position if self.loop else None, jpeg)
+            position += 1
+
+            if interval:
+                self._stop.wait(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,284 @@
+import time
+
+import cv2
+import numpy as np
+
+# Detector output, one row per face with coordinates normalized to 0-1
+BOX_DTYPE = np.dtype([
+    ('x', np.float32), ('y', np.float32), ('w', np.float32), ('h', np.float32),
+    ('confidence', np.float32),
+])
+# Tracker output, the same rows with a numeric track id in front
+TRACK_DTYPE = np.dtype([('track', np.int64)] + BOX_DTYPE.descr)
+
+
+class FaceDetector:
+    """Haar cascade face detector bundled with opencv-python"""
+
+    def __init__(self, input_width=640, min_face=24, cascade='haarcascade_frontalface_default.xml'):
+        self.input_width = input_width
+        self.min_face = min_face
+        self.classifier = cv2.CascadeClassifier(cv2.data.haarcascades + cascade)
+        if self.classifier.empty():
+            raise RuntimeError(f"Could not load cascade '{cascade}'")
+        # Anything that changes the output must change the version
+        self.version = f'haar:{cascade}:{input_width}:{min_face}:{cv2.__version__}'
+
+    def detect(self, frame):
+        """Return BOX_DTYPE rows with coordinates normalized to 0-1"""
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.input_width / width)
+        small = cv2.resize(frame, (int(width * scale), int(height * scale)),
+                           interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        gray = cv2.equalizeHist(gray)
+
+        boxes, _, weights = self.classifier.detectMultiScale3(
+            gray, scaleFactor=1.1, minNeighbors=5,
+            minSize=(self.min_face, self.min_face), outputRejectLevels=True,
+        )
+
+        sh, sw = gray.shape[:2]
+        return make_boxes(boxes, level_weight_confidence(weights), sw, sh)
+
+
+class TiledDetector:
+    """Find distant faces by detecting on native-resolution tiles
+
+    The whole frame still goes through the detector downscaled, which
+    catches near faces. Overlapping tiles are then run at full resolution,
+    but only where there was motion or a face was tracked, and both sets of
+    boxes are merged with NMS.
+    """
+
+    def __init__(self, detector, tile_size=480, overlap=0.25, nms_threshold=0.4, padding=0.05):
+        self.detector = detector
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.nms_threshold = nms_threshold
+        self.padding = padding
+        self.version = f'{detector.version}+tiles:{tile_size}:{overlap}:{nms_threshold}'
+        self.runs = 0
+        self.tiles_run = 0
+        self.grid_size = 0
+        self._grids = {}
+
+    def grid(self, width, height):
+        """Overlapping tiles covering a frame, as pixel (x0, y0, x1, y1) rows"""
+        key = (width, height)
+        if key not in self._grids:
+            stride = max(1, int(self.tile_size * (1 - self.overlap)))
+
+            def starts(length):
+                last = max(0, length - self.tile_size)
+                return sorted(set(list(range(0, last, stride)) + [last]))
+
+            self._grids[key] = np.array(
+                [(x, y, min(width, x + self.tile_size), min(height, y + self.tile_size))
+                 for y in starts(height) for x in starts(width)],
+                dtype=np.float32,
+            )
+        return self._grids[key]
+
+    def active(self, tiles, width, height, motion_mask=None, boxes=None):
+        """Tiles that overlap a moved thumbnail pixel or a padded prior box"""
+        regions = []
+        if boxes is not None and len(boxes):
+            regions.append(np.stack([
+                (boxes['x'] - self.padding) * width,
+                (boxes['y'] - self.padding) * height,
+                (boxes['x'] + boxes['w'] + self.padding) * width,
+                (boxes['y'] + boxes['h'] + self.padding) * height,
+            ], axis=1))
+
+        if motion_mask is not None and motion_mask.any():
+            rows, cols = np.nonzero(motion_mask)
+            mh, mw = motion_mask.shape[:2]
+            sx, sy = width / mw, height / mh
+            regions.append(np.stack([cols * sx, rows * sy, (cols + 1) * sx, (rows + 1) * sy], axis=1))
+
+        if not regions:
+            return tiles[:0]
+
+        regions = np.concatenate(regions).astype(np.float32)
+        hits = ((tiles[:, None, 0] < regions[None, :, 2]) & (tiles[:, None, 2] > regions[None, :, 0])
+                & (tiles[:, None, 1] < regions[None, :, 3]) & (tiles[:, None, 3] > regions[None, :, 1]))
+        return tiles[hits.any(axis=1)]
+
+    def detect(self, frame, motion_mask=None, boxes=None):
+        """Return BOX_DTYPE rows normalized to the whole frame"""
+        height, width = frame.shape[:2]
+        tiles = self.grid(width, height)
+        active = self.active(tiles, width, height, motion_mask, boxes)
+
+        parts = [self.detector.detect(frame)]
+        for x0, y0, x1, y1 in active.astype(int):
+            found = self.detector.detect(frame[y0:y1, x0:x1])
+            tw, th = x1 - x0, y1 - y0
+            found['x'] = (x0 + found['x'] * tw) / width
+            found['y'] = (y0 + found['y'] * th) / height
+            found['w'] *= tw / width
+            found['h'] *= th / height
+            parts.append(found)
+
+        self.runs += 1
+        self.tiles_run += len(active)
+        self.grid_size = len(tiles)
+
+        results = np.concatenate(parts)
+        if len(results) < 2:
+            return results
+        return results[nms(results, self.nms_threshold)]
+
+    def snapshot(self):
+        return {
+            'gridTiles': self.grid_size,
+            'meanActiveTiles': round(self.tiles_run / self.runs, 2) if self.runs else None,
+            'runs': self.runs,
+        }
+
+
+def make_boxes(rects, confidences, width, height):
+    """Pixel (x, y, w, h) rects to clipped, normalized BOX_DTYPE rows"""
+    rects = np.asarray(rects, dtype=np.float32).reshape(-1, 4)
+    boxes = np.empty(len(rects), dtype=BOX_DTYPE)
+    boxes['x'] = rects[:, 0] / width
+    boxes['y'] = rects[:, 1] / height
+    boxes['w'] = rects[:, 2] / width
+    boxes['h'] = rects[:, 3] / height
+    boxes['confidence'] = np.asarray(confidences, dtype=np.float32).reshape(-1)
+    return clip_boxes(boxes)
+
+
+def clip_boxes(boxes):
+    """Clip normalized boxes to the frame in place and return them"""
+    x1 = np.clip(boxes['x'] + boxes['w'], 0.0, 1.0)
+    y1 = np.clip(boxes['y'] + boxes['h'], 0.0, 1.0)
+    boxes['x'] = np.clip(boxes['x'], 0.0, 1.0)
+    boxes['y'] = np.clip(boxes['y'], 0.0, 1.0)
+    boxes['w'] = x1 - boxes['x']
+    boxes['h'] = y1 - boxes['y']
+    return boxes
+
+
+def level_weight_confidence(weights):
+    """Squash cascade level weights (unbounded) into 0-1 confidences"""
+    weights = np.asarray(weights, dtype=np.float32).reshape(-1)
+    return np.clip(1.0 - np.exp(-weights / 3.0), 0.05, 0.99)
+
+
+def pairwise_iou(a, b):
+    """IoU of every box in a against every box in b, as a len(a) x len(b) matrix"""
+    ax0, ay0 = a['x'][:, None], a['y'][:, None]
+    ax1, ay1 = ax0 + a['w'][:, None], ay0 + a['h'][:, None]
+    bx0, by0 = b['x'][None, :], b['y'][None, :]
+    bx1, by1 = bx0 + b['w'][None, :], by0 + b['h'][None, :]
+
+    inter = (np.clip(np.minimum(ax1, bx1) - np.maximum(ax0, bx0), 0, None)
+             * np.clip(np.minimum(ay1, by1) - np.maximum(ay0, by0), 0, None))
+    union = (a['w'] * a['h'])[:, None] + (b['w'] * b['h'])[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def nms(boxes, threshold=0.4):
+    """Indices of BOX_DTYPE rows kept by greedy non-maximum suppression"""
+    x0, y0 = boxes['x'], boxes['y']
+    x1, y1 = x0 + boxes['w'], y0 + boxes['h']
+    areas = boxes['w'] * boxes['h']
+
+    order = np.argsort(-boxes['confidence'], kind='stable')
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        # Overlap of the best remaining box with all others in one step
+        inter = (np.clip(np.minimum(x1[best], x1[rest]) - np.maximum(x0[best], x0[rest]), 0, None)
+                 * np.clip(np.minimum(y1[best], y1[rest]) - np.maximum(y0[best], y0[rest]), 0, None))
+        union = areas[best] + areas[rest] - inter
+        overlap = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+        order = rest[overlap <= threshold]
+    return np.array(keep, dtype=np.intp)
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0.0, x1 - x0) * max(0.0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def box_tuple(row):
+    """(x, y, w, h) floats of one BOX_DTYPE or TRACK_DTYPE row"""
+    return float(row['x']), float(row['y']), float(row['w']), float(row['h'])
+
+
+def to_json(tracks, prefix, feeds=('live',), target=None):
+    """Convert TRACK_DTYPE rows to the dashboard's Detection dicts"""
+    # Column-wise tolist() is one conversion per field instead of one per value
+    columns = list(zip(tracks['track'].tolist(), tracks['x'].tolist(), tracks['y'].tolist(),
+                       tracks['w'].tolist(), tracks['h'].tolist(), tracks['confidence'].tolist()))
+
+    detections = []
+    for feed in feeds:
+        feed_prefix = prefix.replace('live', feed, 1)
+        for track, x, y, w, h, confidence in columns:
+            detections.append({
+                'id': f'{feed_prefix}-{track}',
+                'feed': feed,
+                'bbox': {'x': x, 'y': y, 'w': w, 'h': h},
+                'confidence': confidence,
+                'isTarget': track == target,
+            })
+    return detections
+
+
+class DetectionTracker:
+    """Keep detection ids stable across frames by greedy IoU matching"""
+
+    def __init__(self, prefix='d-live', iou_threshold=0.3, max_age=1.0):
+        self.prefix = prefix
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self._tracks = np.empty(0, dtype=TRACK_DTYPE)
+        self._seen = np.empty(0, dtype=np.float64)
+        self._next_id = 1
+
+    def label(self, track):
+        """Detection id of a track as the API shows it"""
+        return f'{self.prefix}-{track}'
+
+    def update(self, boxes, now=None):
+        """Assign track ids to BOX_DTYPE rows; returns TRACK_DTYPE rows"""
+        now = time.monotonic() if now is None else now
+        tracks = self._tracks
+
+        assigned = np.full(len(boxes), -1, dtype=np.intp)
+        matched = np.zeros(len(tracks), dtype=bool)
+        if len(tracks) and len(boxes):
+            overlaps = pairwise_iou(tracks, boxes)
+            rows, cols = np.nonzero(overlaps >= self.iou_threshold)
+            # Greedy over the candidate pairs only, best overlap first
+            for i in np.argsort(-overlaps[rows, cols], kind='stable'):
+                track_index, box_index = rows[i], cols[i]
+                if matched[track_index] or assigned[box_index] >= 0:
+                    continue
+                assigned[box_index] = track_index
+                matched[track_index] = True
+
+        results = np.empty(len(boxes), dtype=TRACK_DTYPE)
+        for name in BOX_DTYPE.names:
+            results[name] = boxes[name]
+        known = assigned >= 0
+        results['track'][known] = tracks['track'][assigned[known]]
+        fresh = np.count_nonzero(~known)
+        results['track'][~known] = np.arange(self._next_id, self._next_id + fresh)
+        self._next_id += fresh
+
+        # Unmatched tracks are kept until they have not been seen for a while
+        kept = ~matched & (now - self._seen <= self.max_age)
+        self._tracks = np.concatenate([tracks[kept], results])
+        self._seen = np.concatenate([self._seen[kept], np.full(len(results), now)])
+
+        return results
@@ -0,0 +1,147 @@
+import bisect
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from detection import BOX_DTYPE
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-1 of a file's contents, read in chunks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """Replay detections of a looping video file instead of recomputing them
+
+    Entries are keyed by frame index and only valid for one (file hash,
+    model version) pair. The cache is kept in a compressed .npz sidecar
+    next to the video, so later runs start with it already filled.
+
+    Detection is sampled, so the frames detected on one loop are not the
+    ones sampled on the next; a lookup accepts the nearest entry within
+    `tolerance` frames.
+    """
+
+    def __init__(self, video_path, model_version, directory=None, tolerance=3):
+        self.video_path = video_path
+        self.model_version = model_version
+        self.tolerance = tolerance
+        self.file_hash = file_digest(video_path)
+
+        directory = directory or os.path.dirname(os.path.abspath(video_path))
+        name = os.path.basename(video_path)
+        self.path = os.path.join(directory, f'{name}.detections.npz')
+
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+        self._entries = {}
+        self._indexes = []
+        self._dirty = False
+        self._last_position = -1
+        self._lock = threading.Lock()
+        self.load()
+
+    def get(self, position):
+        """Cached BOX_DTYPE rows for a frame index, or None"""
+        with self._lock:
+            at = bisect.bisect_left(self._indexes, position)
+            best = None
+            for index in self._indexes[max(0, at - 1):at + 1]:
+                if abs(index - position) <= self.tolerance and (
+                        best is None or abs(index - position) < abs(best - position)):
+                    best = index
+
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._entries[best].copy()
+
+    def put(self, position, boxes):
+        """Store the detections of a frame; saves the sidecar when the file loops"""
+        looped = False
+        with self._lock:
+            if position not in self._entries:
+                bisect.insort(self._indexes, position)
+                self._dirty = True
+            self._entries[position] = np.array(boxes, dtype=BOX_DTYPE)
+            looped = position < self._last_position
+            self._last_position = position
+
+        if looped:
+            self.save()
+
+    def load(self):
+        """Fill the cache from the sidecar if it matches the file and model"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                if (str(data['file_hash']) != self.file_hash
+                        or str(data['model_version']) != self.model_version):
+                    print(f"⚠️  Ignoring stale detection cache {self.path}")
+                    return
+                indexes = data['indexes'].tolist()
+                offsets = data['offsets']
+                boxes = data['boxes']
+        except Exception as e:
+            print(f"⚠️  Could not read detection cache {self.path}: {e}")
+            return
+
+        with self._lock:
+            self._entries = {
+                index: boxes[offsets[i]:offsets[i + 1]]
+                for i, index in enumerate(indexes)
+            }
+            self._indexes = indexes
+        print(f"✅ Loaded {len(indexes)} cached detection frames for {self.video_path}")
+
+    def save(self):
+        """Write new entries to the sidecar (one flat array plus offsets)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            indexes = list(self._indexes)
+            parts = [self._entries[index] for index in indexes]
+            self._dirty = False
+
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(part) for part in parts])
+        boxes = np.concatenate(parts) if parts else np.empty(0, dtype=BOX_DTYPE)
+
+        # Write next to the target and rename, so readers never see half a file
+        partial = self.path + '.part.npz'
+        try:
+            np.savez_compressed(
+                partial,
+                file_hash=np.array(self.file_hash),
+                model_version=np.array(self.model_version),
+                indexes=np.array(indexes, dtype=np.int64),
+                offsets=offsets,
+                boxes=boxes,
+            )
+            os.replace(partial, self.path)
+            self.saves += 1
+        except OSError as e:
+            self._dirty = True
+            print(f"⚠️  Could not write detection cache {self.path}: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'frames': len(self._indexes),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else None,
+                'saves': self.saves,
+                'sidecar': self.path,
+            }
@@ -0,0 +1,79 @@
+import threading
+
+import numpy as np
+
+
+class FramePool:
+    """Preallocated frame arrays, reused oldest first once nobody leases them
+
+    FrameHub leases the frame it publishes and hands that lease on to
+    every consumer that reads the frame, so an array is only decoded into
+    again after all of them released it. When every array is leased the
+    capture gets a fresh, untracked one instead of waiting.
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self.allocated = 0
+        self.reused = 0
+        self._arrays = []
+        self._shape = None
+        self._next = 0
+        # id(array) -> number of open leases
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, shape, dtype=np.uint8):
+        """Return the oldest unleased array of the given shape, allocating while the ring fills"""
+        with self._lock:
+            if shape != self._shape:
+                # Resolution changed, the old arrays are useless now
+                self._reset(shape)
+
+            if len(self._arrays) < self.size:
+                array = np.empty(shape, dtype=dtype)
+                self.allocated += 1
+                self._arrays.append(array)
+                return array
+
+            for offset in range(len(self._arrays)):
+                index = (self._next + offset) % len(self._arrays)
+                array = self._arrays[index]
+                if not self._leases.get(id(array)):
+                    self._next = index + 1
+                    self.reused += 1
+                    return array
+
+            # Every array is leased: hand out one the pool does not track
+            self.allocated += 1
+            return np.empty(shape, dtype=dtype)
+
+    def adopt(self, array):
+        """Track an array the capture allocated itself (first read, new size)"""
+        with self._lock:
+            if array.shape != self._shape:
+                self._reset(array.shape)
+            if len(self._arrays) < self.size and not any(a is array for a in self._arrays):
+                self._arrays.append(array)
+
+    def lease(self, array):
+        """Keep an array out of reuse until release(); other arrays are ignored"""
+        with self._lock:
+            if any(a is array for a in self._arrays):
+                self._leases[id(array)] = self._leases.get(id(array), 0) + 1
+                return True
+            return False
+
+    def release(self, array):
+        with self._lock:
+            count = self._leases.get(id(array), 0) - 1
+            if count > 0:
+                self._leases[id(array)] = count
+            else:
+                self._leases.pop(id(array), None)
+
+    def _reset(self, shape):
+        self._arrays = []
+        self._leases = {}
+        self._shape = shape
+        self._next = 0
@@ -1,14 +1,32 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response, FileResponse
+import asyncio
 import cv2
+import json
+import os
+import sys
+import threading
 import time
 from datetime import datetime
-import base64
-import io
-from PIL import Image
 import numpy as np
 
+from analytics import AnalyticsPipeline, InferenceBudget
+from batch import BatchJobs
+from detection import DetectionTracker, FaceDetector, TiledDetector
+from detection_cache import DetectionCache
+from mosaic import MosaicComposer
+from portraits import PortraitCache
+from qos import ProcessCpu, QosController
+from quality import BestShotBuffer
+from readiness import ReadinessTracker
+from recognition import RecognitionCache, TargetMatcher
+from renditions import MULTIPART_TRAILER, metadata_header, multipart_part, scale_to_height
+from sources import CameraSource, is_live_source
+from tilediff import TileDiffEncoder
+from transport import (MESSAGE_FRAME, MESSAGE_TILES, CreditWindow, frame_layout, json_delta,
+                       pack_frame, wall_clock_ms)
+
 app = FastAPI(title="INTAI Backend API")
 
 # CORS middleware
@@ -31,85 +49,403 @@ CAMERA_CONFIG = {
     'location': 'Terminal 2 / Concourse F',
 }
 
-# Global variables for camera capture
+# All cameras served by this node; the first one is the default for every
+# endpoint's ?camera= parameter. 'source' is a device index, a video file
+# or a stream URL, e.g.
+#   {'cameraId': 'R-39-F-004', 'cameraName': 'CAM 41B',
+#    'location': 'Terminal 2 / Concourse F', 'source': 'rtsp://10.0.12.45/stream1'}
+CAMERAS = [
+    {
+        **CAMERA_CONFIG,
+        'source': CAMERA_INDEX if USE_WEBCAM else VIDEO_FILE,
+    },
+]
+
+# Per-stage sampling policy in frames per second. 'display' paces viewers,
+# the rest are analytics stages. Override per camera with a 'sampling' key
+DEFAULT_SAMPLING_POLICY = {
+    'display': 30,
+    'motion': 10,
+    'detection': 5,
+    'matching': 1,
+}
+
+# Analytics frames per second shared by all cameras, handed out by priority
+# (target > motion > idle), and the rate every camera is guaranteed
+INFERENCE_BUDGET_FPS = {'detection': 12, 'matching': 3}
+INFERENCE_MIN_FPS = {'detection': 0.5, 'matching': 0.2}
+
+# Face detection on the live cameras. Off by default: the dashboard then
+# shows the mock detection data
+ANALYTICS_ENABLED = False
+# Target matching compares equalized grayscale crops with the reference
+# portrait. That is a placeholder, not identity recognition, so it stays
+# off unless explicitly wanted; detections are then never flagged as target
+TARGET_MATCHING_ENABLED = False
+MOTION_HOLD_SECONDS = 2.0
+TARGET_LABEL = 'VIP1'
+TARGET_REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'public', 'VIP1.jpg')
+TARGET_MATCH_THRESHOLD = 0.5
+
+# 'tiled' adds native-resolution tiles where there is motion or a tracked
+# face to the downscaled whole-frame pass, 'frame' runs the whole frame only
+DETECTION_MODE = 'tiled'
+DETECTION_TILE_SIZE = 480
+DETECTION_TILE_OVERLAP = 0.25
+DETECTION_NMS_IOU = 0.4
+
+# Video files loop, so detections from the first pass are replayed on later
+# ones and kept in a <video>.detections.npz sidecar (next to the video, or in
+# DETECTION_CACHE_DIR). Lookups accept the nearest cached frame within
+# DETECTION_CACHE_TOLERANCE frames, as detection is sampled
+DETECTION_CACHE_ENABLED = True
+DETECTION_CACHE_DIR = None
+DETECTION_CACHE_TOLERANCE = 3
+
+# Recognition results are cached per detection id and only recomputed when
+# the crop gets RECOGNITION_QUALITY_GAIN better, the box overlaps its cached
+# position less than RECOGNITION_MIN_IOU, or the result is older than the TTL
+RECOGNITION_TTL_SECONDS = 5.0
+RECOGNITION_QUALITY_GAIN = 0.25
+RECOGNITION_MIN_IOU = 0.5
+
+# Best-shot buffer: face crops are scored on sharpness, size and exposure
+# and only the top ones per detection id go to recognition and the portrait
+BEST_SHOTS_PER_DETECTION = 3
+BEST_SHOT_MIN_QUALITY = 0.35
+BEST_SHOT_MAX_AGE_SECONDS = 10.0
+
+# Rendition ladder, picked by viewers with ?rendition=<name>
+RENDITION_LADDER = {
+    '720p': {'height': 720, 'quality': 85},
+    '360p': {'height': 360, 'quality': 70},
+    '180p': {'height': 180, 'quality': 60},
+}
+DEFAULT_RENDITION = '720p'
+
+# Skip encoding and sending frames when the scene has not changed,
+# but still send a keep-alive frame every STATIC_KEEPALIVE_SECONDS
+SUPPRESS_STATIC_FRAMES = True
+STATIC_KEEPALIVE_SECONDS = 2.0
+
+# Video wall mosaic of every camera, composed and encoded once on the server
+MOSAIC_TILE_SIZE = (320, 180)
+MOSAIC_FPS = 10
+MOSAIC_QUALITY = 75
+
+# Segmented MP4 output, written only while the playlist is being polled
+SEGMENT_SECONDS = 2.0
+SEGMENT_WINDOW = 6
+SEGMENT_FPS = 15
+SEGMENT_HEIGHT = 720
+
+# Adaptive QoS: shed load when any signal stays above its high watermark,
+# restore when all are below their low watermarks. (high, low) per signal
+QOS_INTERVAL_SECONDS = 1.0
+QOS_WATERMARKS = {
+    'cpu': (0.90, 0.60),            # this process's CPU per core
+    'loopLagMs': (100.0, 20.0),     # event loop wake-up delay
+    'captureAgeP95Ms': (250.0, 100.0),
+}
+
+# Offline batch analysis of archived footage. Jobs may only read files under
+# BATCH_MEDIA_DIR; BATCH_WORKERS=None uses every core
+BATCH_MEDIA_DIR = os.path.dirname(os.path.abspath(__file__))
+BATCH_WORKERS = None
+
+# Portrait crops are served from memory at content-hash URLs
+PORTRAIT_CACHE_BYTES = 4 * 1024 * 1024
+PORTRAIT_FALLBACK_URL = '/VIP1.jpg'
+
 # Use AVFoundation on macOS for USB cams
-camera = cv2.VideoCapture(CAMERA_INDEX, cv2.CAP_AVFOUNDATION)
-
-def get_camera():
-    """Get or initialize camera capture"""
-    global camera
-    
-    if camera is None or not camera.isOpened():
-        if USE_WEBCAM:
-            camera = cv2.VideoCapture(CAMERA_INDEX)
-            # Set camera properties for better quality
-            camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-            camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-            camera.set(cv2.CAP_PROP_FPS, 30)
-        else:
-            camera = cv2.VideoCapture(VIDEO_FILE)
+CAMERA_BACKEND = cv2.CAP_AVFOUNDATION if sys.platform == 'darwin' else cv2.CAP_ANY
+
+# 'latest' drains the device buffer and decodes only the newest frame (live
+# cameras only), 'buffered' reads frames in order
+CAPTURE_MODE = 'latest'
+
+# Frame arrays the capture thread decodes into instead of allocating. A
+# frame is leased by everyone reading it and only reused once all gave it
+# back; if all are leased the capture allocates a fresh array
+FRAME_POOL_SIZE = 6
+
+# Forward the JPEGs of MJPEG cameras to viewers unchanged and decode them
+# only when analytics needs pixels. Cameras that deliver anything else fall
+# back to decoding every frame
+CAPTURE_PASSTHROUGH = True
+
+# Stop reading a camera this long after its last consumer left. Resuming
+# must take at most IDLE_RESUME_SECONDS, so the device is only released
+# when it reopens faster than that
+IDLE_GRACE_SECONDS = 10.0
+IDLE_RESUME_SECONDS = 1.0
+
+# Reconnect backoff for a lost capture source (seconds, doubled per attempt)
+RECONNECT_BASE_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+RECONNECT_JITTER = 0.25
+OFFLINE_FRAME_INTERVAL = 0.5
+
+# WebSocket video: the most frames a client may have outstanding credit for
+WS_MAX_CREDITS = 8
+# How often the multiplexed stream checks the dashboard for changes
+DASHBOARD_PUSH_INTERVAL = 0.5
+
+# Tile-diff WebSocket streaming for fixed cameras: a keyframe every
+# TILE_KEYFRAME_SECONDS (or when over TILE_MAX_CHANGED of the tiles changed),
+# otherwise only the changed TILE_SIZE x TILE_SIZE tiles
+TILE_SIZE = 64
+TILE_KEYFRAME_SECONDS = 2.0
+TILE_MAX_CHANGED = 0.5
+
+readiness = ReadinessTracker()
+portrait_cache = PortraitCache(PORTRAIT_CACHE_BYTES)
+qos = QosController(interval=QOS_INTERVAL_SECONDS)
+budget = InferenceBudget(INFERENCE_BUDGET_FPS, INFERENCE_MIN_FPS)
+jobs = BatchJobs(workers=BATCH_WORKERS)
+ws_stats = {'connections': 0, 'framesSent': 0, 'framesSkipped': 0,
+            'tileKeyframes': 0, 'tileUpdates': 0, 'tileBytesSent': 0}
+
+def open_camera(source):
+    """Open a capture source (only called by its supervisor)"""
+    if isinstance(source, int):
+        cam = cv2.VideoCapture(source, CAMERA_BACKEND)
+        # Set camera properties for better quality
+        cam.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        cam.set(cv2.CAP_PROP_FPS, 30)
+    else:
+        cam = cv2.VideoCapture(source)
     
-    return camera
+    return cam
 
-def generate_frames():
-    """Generate video frames for streaming"""
-    while True:
-        cam = get_camera()
-        
-        if cam is None or not cam.isOpened():
-            # Send a blank frame if camera is not available
-            blank = np.zeros((480, 640, 3), dtype=np.uint8)
-            ret, buffer = cv2.imencode('.jpg', blank)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.1)
-            continue
-        
-        success, frame = cam.read()
-        
-        if not success:
-            # If it's a video file, loop it
-            if not USE_WEBCAM:
-                cam.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            time.sleep(0.1)
-            continue
-        
-        # Encode frame as JPEG
-        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        frame_bytes = buffer.tobytes()
-        
-        # Yield frame in multipart format
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        
-        # Control frame rate (30 fps = ~33ms per frame)
-        time.sleep(0.033)
+def render_offline_frame():
+    """Encode the frame shown to viewers while the camera is offline"""
+    blank = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(blank, 'CAMERA OFFLINE', (170, 250), cv2.FONT_HERSHEY_SIMPLEX,
+                1.0, (80, 80, 80), 2, cv2.LINE_AA)
+    ret, buffer = cv2.imencode('.jpg', blank)
+    return multipart_part(buffer)
+
+OFFLINE_PART = render_offline_frame()
+
+def stage_scale(camera_id, stage):
+    """Analytics stages slow down under QoS pressure and the shared budget"""
+    if stage == 'display':
+        return 1.0
+    return qos.analytics_scale * budget.scale(camera_id, stage)
+
+cameras = {}
+for camera_config in CAMERAS:
+    camera_source = CameraSource(
+        camera_config,
+        open_camera,
+        RENDITION_LADDER,
+        {**DEFAULT_SAMPLING_POLICY, **camera_config.get('sampling', {})},
+        stage_scale,
+        portrait_cache,
+        frame_pool_size=FRAME_POOL_SIZE,
+        capture_options={
+            'mode': CAPTURE_MODE,
+            'passthrough': CAPTURE_PASSTHROUGH,
+            'idle_grace': IDLE_GRACE_SECONDS,
+            'resume_latency': IDLE_RESUME_SECONDS,
+            'base_delay': RECONNECT_BASE_DELAY,
+            'max_delay': RECONNECT_MAX_DELAY,
+            'jitter': RECONNECT_JITTER,
+        },
+        segment_options={
+            'segment_seconds': SEGMENT_SECONDS,
+            'window': SEGMENT_WINDOW,
+            'fps': SEGMENT_FPS,
+            'height': SEGMENT_HEIGHT,
+        },
+    )
+    cameras[camera_source.camera_id] = camera_source
+    # Demand before the budget: the camera's policy, slowed only by QoS
+    budget.register(
+        camera_source.camera_id,
+        lambda stage, policy=camera_source.scheduler.policy: policy.get(stage, 0) * qos.analytics_scale,
+    )
+
+DEFAULT_CAMERA = CAMERAS[0]['cameraId']
+
+mosaic = MosaicComposer(cameras.values(), tile_size=MOSAIC_TILE_SIZE, fps=MOSAIC_FPS,
+                        quality=MOSAIC_QUALITY)
+
+def get_source(camera_id=None):
+    """Look up a camera by id, defaulting to the first configured one"""
+    source = cameras.get(camera_id or DEFAULT_CAMERA)
+    if source is None:
+        raise HTTPException(status_code=404, detail=f"Unknown camera '{camera_id}'")
+    return source
+
+def worst_capture_age_p95():
+    """Highest p95 capture age across cameras, in milliseconds
+
+    Stands in for queue depth: FrameHub keeps only the newest frame, so a
+    backlog shows up as frames getting older before viewers pick them up.
+    None (probe skipped) when no camera had a viewer recently.
+    """
+    values = [s.capture_age.snapshot(scale=1000)['p95'] for s in cameras.values()]
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
+
+qos.add_probe('cpu', ProcessCpu(), *QOS_WATERMARKS['cpu'])
+qos.add_probe('loopLagMs', lambda: qos.loop_lag * 1000, *QOS_WATERMARKS['loopLagMs'])
+qos.add_probe('captureAgeP95Ms', worst_capture_age_p95, *QOS_WATERMARKS['captureAgeP95Ms'])
+
+def degraded_rendition(rendition, source=None):
+    """Step a rendition down the ladder by the current QoS shift
+
+    A passthrough camera sends its JPEG at that rendition for free, while
+    a smaller one costs a decode, resize and encode per frame; its viewers
+    keep the rendition and QoS only sheds their frame rate.
+    """
+    if source is not None and source.passes_through(rendition):
+        return rendition
+    names = list(RENDITION_LADDER)
+    index = min(names.index(rendition) + qos.rendition_shift, len(names) - 1)
+    return names[index]
+
+def frame_metadata(source, feed_type, frame_id, captured_at):
+    """Sequence number, capture time and detections that travel with a frame"""
+    metadata = {
+        'seq': frame_id,
+        'capturedAt': wall_clock_ms(captured_at),
+        'detectionSeq': None,
+        'detections': [],
+    }
+    if source.analytics is not None:
+        metadata.update(source.analytics.annotations(feed_type))
+    return metadata
+
+async def generate_frames(source, requested=DEFAULT_RENDITION, feed_type='live', metadata=False):
+    """Generate video frames for streaming, optionally with per-frame metadata headers
+
+    Async so that a client disconnect cancels it and the finally block
+    releases the subscriptions; blocking steps run in worker threads.
+    """
+    source.supervisor.subscribe()
+    rendition = degraded_rendition(requested, source)
+    source.renditions.subscribe(rendition)
+    last_id = 0
+    sent_thumb = None
+    last_sent = 0.0
+    # Leased pooled frame, so the capture cannot decode into it while in use
+    held = None
+    
+    try:
+        while True:
+            source.frame_hub.release(held)
+            held = None
+            # Passthrough frames arrive undecoded, see rendition_inputs()
+            latest = await source.frame_hub.wait_frame(last_id, decode=False, lease=True)
+            
+            if latest is None:
+                if not source.supervisor.is_online():
+                    # Send the cached offline frame while the supervisor reconnects
+                    yield OFFLINE_PART
+                    await asyncio.sleep(OFFLINE_FRAME_INTERVAL)
+                continue
+            
+            last_id, frame, captured_at = latest
+            held = frame
+            source.capture_age.observe(time.monotonic() - captured_at)
+            
+            if SUPPRESS_STATIC_FRAMES:
+                # Compare against the last frame this viewer was sent, so slow
+                # drift still accumulates into a change eventually. Passthrough
+                # frames only get a cheap reduced grayscale decode for this
+                if frame is not None:
+                    thumb = await asyncio.to_thread(source.change_detector.thumbnail, last_id, frame)
+                else:
+                    jpeg = source.frame_hub.jpeg(last_id)
+                    if jpeg is None:
+                        continue
+                    thumb = await asyncio.to_thread(
+                        source.change_detector.jpeg_thumbnail, last_id, jpeg)
+                    if thumb is None:
+                        continue
+                now = time.monotonic()
+                if (not source.change_detector.changed(sent_thumb, thumb)
+                        and now - last_sent < STATIC_KEEPALIVE_SECONDS):
+                    await asyncio.sleep(0.033)
+                    continue
+                sent_thumb = thumb
+                last_sent = now
+            
+            # Follow QoS rendition changes, moving the subscription with it
+            effective = degraded_rendition(requested, source)
+            if effective != rendition:
+                source.renditions.subscribe(effective)
+                source.renditions.unsubscribe(rendition)
+                rendition = effective
+            
+            started = time.monotonic()
+            frame, jpeg, source_height = await asyncio.to_thread(
+                source.rendition_inputs, rendition, last_id, frame)
+            if frame is None and jpeg is None:
+                continue
+            
+            if metadata:
+                # Only the header is per viewer, the JPEG bytes are shared
+                body = await asyncio.to_thread(
+                    source.renditions.body, rendition, frame, last_id, jpeg, source_height)
+                source.frame_hub.release(held)
+                held = None
+                if body is None:
+                    continue
+                yield metadata_header(frame_metadata(source, feed_type, last_id, captured_at),
+                                      len(body) - len(MULTIPART_TRAILER))
+                yield body
+            else:
+                # Encode and frame as a multipart JPEG part, once per rendition
+                # and shared with every other viewer of it
+                part = await asyncio.to_thread(
+                    source.renditions.multipart, rendition, frame, last_id, jpeg, source_height)
+                source.frame_hub.release(held)
+                held = None
+                if part is None:
+                    continue
+                
+                yield part
+            source.record_display(last_id, time.monotonic() - started)
+            
+            # Control frame rate from the display policy, slower under QoS
+            await asyncio.sleep(source.scheduler.interval('display') / qos.fps_scale)
+    finally:
+        source.frame_hub.release(held)
+        source.renditions.unsubscribe(rendition)
+        source.supervisor.unsubscribe()
 
 class CameraMetadataExtractor:
+    def __init__(self, source):
+        self.source = source
+        self.config = source.config
+    
     def get_metadata(self):
-        """Extract metadata from camera"""
+        """Extract metadata from the capture's published snapshot"""
         try:
-            cam = get_camera()
+            # Probed once by the capture thread, never read from the device here
+            supervisor = self.source.supervisor
+            info = supervisor.info
             
-            if cam is None or not cam.isOpened():
+            if info is None or not supervisor.is_online():
                 return self._offline_metadata()
             
-            # Extract video properties
-            fps = int(cam.get(cv2.CAP_PROP_FPS))
-            width = int(cam.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cam.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            
-            # Get codec info
-            fourcc = int(cam.get(cv2.CAP_PROP_FOURCC))
-            codec = "".join([chr((fourcc >> 8 * i) & 0xFF) for i in range(4)])
+            fps = int(info.fps)
+            width = info.width
+            height = info.height
+            codec = info.codec
             
-            camera_type = "Webcam" if USE_WEBCAM else "Video File"
+            is_webcam = self.source.is_webcam
+            camera_type = "Webcam" if is_webcam else "Video File" if supervisor.loop else "Network Stream"
             
             return {
-                'cameraId': CAMERA_CONFIG['cameraId'],
-                'cameraName': CAMERA_CONFIG['cameraName'],
-                'location': CAMERA_CONFIG['location'],
+                'cameraId': self.config['cameraId'],
+                'cameraName': self.config['cameraName'],
+                'location': self.config['location'],
                 'status': 'online',
                 'latencyMs': 45 + int(time.time() % 30),  # Simulated latency
                 'fps': fps if fps > 0 else 30,
@@ -117,9 +453,9 @@ class CameraMetadataExtractor:
                 'device': {
                     'model': camera_type,
                     'firmware': '1.0.0',
-                    'ip': 'localhost' if USE_WEBCAM else '10.0.12.44',
+                    'ip': 'localhost' if is_webcam else '10.0.12.44',
                     'codec': codec.strip() if codec.strip() else 'MJPEG',
-                    'lens': 'Built-in' if USE_WEBCAM else 'N/A',
+                    'lens': 'Built-in' if is_webcam else 'N/A',
                     'irMode': 'N/A',
                 }
             }
@@ -130,9 +466,9 @@ class CameraMetadataExtractor:
     def _offline_metadata(self):
         """Return offline metadata"""
         return {
-            'cameraId': CAMERA_CONFIG['cameraId'],
-            'cameraName': CAMERA_CONFIG['cameraName'],
-            'location': CAMERA_CONFIG['location'],
+            'cameraId': self.config['cameraId'],
+            'cameraName': self.config['cameraName'],
+            'location': self.config['location'],
             'status': 'offline',
             'latencyMs': 0,
             'fps': 0,
@@ -147,18 +483,39 @@ class CameraMetadataExtractor:
             }
         }
 
-def generate_placeholder_portrait():
-    """Generate a simple placeholder portrait image"""
-    # Create a simple silhouette-like image
-    img = Image.new('RGB', (200, 200), color=(26, 31, 38))
+def get_target_portrait_url(source, detections):
+    """Return the URL of the current target's face crop
+
+    Crops, resizes and encodes, so callers run it off the event loop.
+    """
+    if source.analytics is None:
+        # Mock detections have made-up boxes, a crop there shows nothing real
+        return PORTRAIT_FALLBACK_URL
     
-    # Convert to base64
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
+    if source.analytics.best_shots is not None:
+        # Best view of the target so far rather than whatever the latest frame shows
+        track, shot = source.analytics.target_shot()
+        if track is None:
+            return PORTRAIT_FALLBACK_URL
+        digest = source.portraits.extract_shot(track, shot)
+        if digest is not None:
+            return f'http://localhost:8080/api/portrait/{digest}.jpg'
     
-    return f"data:image/png;base64,{img_base64}"
+    target = next((d for d in detections if d['isTarget'] and d['feed'] == 'live'), None)
+    if target is None:
+        return PORTRAIT_FALLBACK_URL
+    
+    frame_id, frame, _ = source.frame_hub.latest(lease=True)
+    if frame is None:
+        return PORTRAIT_FALLBACK_URL
+    try:
+        digest = source.portraits.extract(frame, frame_id, target['bbox'])
+    finally:
+        source.frame_hub.release(frame)
+    if digest is None:
+        return PORTRAIT_FALLBACK_URL
+    
+    return f'http://localhost:8080/api/portrait/{digest}.jpg'
 
 def generate_detections():
     """Generate some mock detections that move slightly"""
@@ -224,16 +581,36 @@ def generate_detections():
     ]
 
 @app.get("/api/dashboard")
-async def get_dashboard(mode: str = None):
+async def get_dashboard(mode: str = None, camera: str = None):
     """Main dashboard endpoint"""
-    
+    # The portrait crop and encode must not block the event loop
+    dashboard = await asyncio.to_thread(build_dashboard, get_source(camera), mode, camera)
+    return JSONResponse(content=dashboard)
+
+def build_dashboard(source, mode=None, camera=None):
+    """Dashboard payload of one camera, shared by the poll and the multiplexed stream"""
     # Extract camera metadata
-    extractor = CameraMetadataExtractor()
+    extractor = CameraMetadataExtractor(source)
     camera_meta = extractor.get_metadata()
     
     # Check if demo mode via query parameter
     is_demo = mode == 'demo'
     
+    # Keep the camera selection on the stream URLs
+    query = f'?camera={source.camera_id}' if camera else ''
+    
+    if source.analytics is not None:
+        detections, match = source.analytics.results()
+    else:
+        detections, match = generate_detections(), None
+    
+    if match is not None:
+        confidence = match['confidence']
+    elif source.analytics is not None:
+        confidence = 0.0
+    else:
+        confidence = 0.20 + 0.15 * ((time.time() % 10) / 10)
+    
     # Build response
     response = {
         'timestamp': datetime.now().isoformat(),
@@ -241,46 +618,697 @@ async def get_dashboard(mode: str = None):
             'live': {
                 'type': 'mp4',
                 # Use relative URLs for demo videos (served by frontend)
-                'url': '/phase4_original.mp4' if is_demo else f'http://localhost:8080/api/video/live',
+                'url': '/phase4_original.mp4' if is_demo else f'http://localhost:8080/api/video/live{query}',
             },
             'manipulated': {
                 'type': 'mp4',
                 # Use relative URLs for demo videos (served by frontend)
-                'url': '/phase4_removed.mp4' if is_demo else f'http://localhost:8080/api/video/manipulated',
+                'url': '/phase4_removed.mp4' if is_demo else f'http://localhost:8080/api/video/manipulated{query}',
             }
         },
         'target': {
-            'portraitUrl': '/VIP1.jpg',
-            'confidence': 0.20 + 0.15 * ((time.time() % 10) / 10),
-            'label': 'VIP1',
+            'portraitUrl': get_target_portrait_url(source, detections),
+            'confidence': confidence,
+            'label': TARGET_LABEL,
         },
         'cameraMeta': camera_meta,
-        'detections': generate_detections(),
+        'detections': detections,
     }
     
-    return JSONResponse(content=response)
+    return response
 
 @app.get("/api/video/{feed_type}")
-async def stream_video(feed_type: str):
-    """Stream video from webcam or file (MJPEG stream)"""
+async def stream_video(feed_type: str, rendition: str = DEFAULT_RENDITION, camera: str = None,
+                       metadata: bool = False):
+    """Stream video from webcam or file (MJPEG stream)
+
+    With ?metadata=true every part also carries X-Frame-Seq, X-Capture-Time
+    and X-Frame-Metadata (JSON with the detections for that frame), so
+    overlays can be drawn against the exact frame instead of a dashboard poll.
+    """
+    source = get_source(camera)
+    if rendition not in RENDITION_LADDER:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown rendition '{rendition}', expected one of {list(RENDITION_LADDER)}"
+        )
+    
+    return StreamingResponse(
+        generate_frames(source, rendition, feed_type, metadata),
+        media_type='multipart/x-mixed-replace; boundary=frame'
+    )
+
+async def receive_control(websocket, windows, options):
+    """Apply client control messages until the socket closes
+
+    {"channel": name, "credits": n} grants credits, {"channel": name,
+    "rendition": r} switches a video channel's rendition. Without a
+    channel the message applies to the first one. Returns 1003 (the close
+    code) if the client sent something that is not a control message.
+    """
+    default = next(iter(windows))
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except (ValueError, KeyError):
+                # Not JSON, or a binary message
+                return 1003
+            if not isinstance(message, dict):
+                return 1003
+            credits = message.get('credits')
+            if credits is not None and (not isinstance(credits, int) or isinstance(credits, bool)):
+                return 1003
+            
+            channel = message.get('channel', default)
+            if not isinstance(channel, str) or channel not in windows:
+                continue
+            if credits is not None:
+                windows[channel].grant(credits)
+            if message.get('rendition') in RENDITION_LADDER and channel in options:
+                options[channel]['rendition'] = message['rendition']
+    except WebSocketDisconnect:
+        return None
+    finally:
+        for window in windows.values():
+            window.close()
+
+async def close_socket(websocket, receiver):
+    """Close the socket after the senders stop, with 1003 after a bad control message"""
+    code = 1000
+    if receiver.done() and not receiver.cancelled() and receiver.exception() is None:
+        code = receiver.result() or 1000
+    try:
+        await websocket.close(code=code)
+    except RuntimeError:
+        # The client closed it already
+        pass
+
+async def send_video(websocket, send_lock, source, feed_type, channel_id, window, options):
+    """Send one feed's frames as binary messages while its window has credit"""
+    names = list(RENDITION_LADDER)
+    source.supervisor.subscribe()
+    current = degraded_rendition(options['rendition'], source)
+    source.renditions.subscribe(current)
+    last_id = 0
     
+    try:
+        while await window.acquire():
+            latest = await source.frame_hub.wait_frame(last_id, decode=False, lease=True)
+            if latest is None:
+                window.grant(1)
+                continue
+            
+            frame_id, frame, captured_at = latest
+            source.capture_age.observe(time.monotonic() - captured_at)
+            if last_id:
+                ws_stats['framesSkipped'] += max(0, frame_id - last_id - 1)
+            last_id = frame_id
+            
+            effective = degraded_rendition(options['rendition'], source)
+            if effective != current:
+                source.renditions.subscribe(effective)
+                source.renditions.unsubscribe(current)
+                current = effective
+            
+            started = time.monotonic()
+            try:
+                frame, jpeg, source_height = await asyncio.to_thread(
+                    source.rendition_inputs, current, frame_id, frame)
+                jpeg = await asyncio.to_thread(source.renditions.encode, current, frame, frame_id,
+                                               jpeg, source_height)
+            finally:
+                source.frame_hub.release(latest[1])
+            if jpeg is None:
+                window.grant(1)
+                continue
+            
+            meta = frame_metadata(source, feed_type, frame_id, captured_at) if options['metadata'] else None
+            message = pack_frame(channel_id, names.index(current), frame_id,
+                                 wall_clock_ms(captured_at), jpeg, meta)
+            async with send_lock:
+                await websocket.send_bytes(message)
+            ws_stats['framesSent'] += 1
+            source.record_display(frame_id, time.monotonic() - started)
+            
+            # Never faster than the display policy, slower under QoS
+            await asyncio.sleep(source.scheduler.interval('display') / qos.fps_scale)
+    except WebSocketDisconnect:
+        window.close()
+    finally:
+        source.renditions.unsubscribe(current)
+        source.supervisor.unsubscribe()
+
+async def send_tiles(websocket, send_lock, source, channel_id, window, options):
+    """Send a keyframe and then only changed tiles, one message per credit"""
+    names = list(RENDITION_LADDER)
+    source.supervisor.subscribe()
+    current = degraded_rendition(options['rendition'])
+    source.renditions.subscribe(current)
+    encoder = TileDiffEncoder(tile_size=TILE_SIZE, keyframe_interval=TILE_KEYFRAME_SECONDS,
+                              max_changed=TILE_MAX_CHANGED,
+                              quality=RENDITION_LADDER[current]['quality'])
+    last_id = 0
+    
+    try:
+        while await window.acquire():
+            message = None
+            while message is None and not window.closed:
+                latest = await source.frame_hub.wait_frame(last_id, lease=True)
+                if latest is None:
+                    continue
+                frame_id, frame, captured_at = latest
+                last_id = frame_id
+                
+                effective = degraded_rendition(options['rendition'])
+                if effective != current:
+                    source.renditions.subscribe(effective)
+                    source.renditions.unsubscribe(current)
+                    current = effective
+                    encoder.reference = None
+                    encoder.quality = RENDITION_LADDER[current]['quality']
+                
+                # Scaling and encoding both run off the event loop. Keyframes
+                # reuse the JPEG the rendition encoder shares with MJPEG viewers
+                started = time.monotonic()
+                try:
+                    encoded = await asyncio.to_thread(
+                        lambda: encoder.encode(
+                            scale_to_height(frame, RENDITION_LADDER[current]['height']), None,
+                            lambda: source.renditions.encode(current, frame, frame_id),
+                        )
+                    )
+                finally:
+                    source.frame_hub.release(frame)
+                if encoded is None:
+                    # Nothing changed: wait for the next frame, keep the credit
+                    continue
+                
+                kind, payload, meta = encoded
+                message = pack_frame(channel_id, names.index(current), frame_id,
+                                     wall_clock_ms(captured_at), payload, meta,
+                                     MESSAGE_FRAME if kind == 'keyframe' else MESSAGE_TILES)
+                ws_stats['tileKeyframes' if kind == 'keyframe' else 'tileUpdates'] += 1
+                ws_stats['tileBytesSent'] += len(payload)
+            
+            if message is None:
+                break
+            async with send_lock:
+                await websocket.send_bytes(message)
+            source.record_display(frame_id, time.monotonic() - started)
+            
+            await asyncio.sleep(source.scheduler.interval('display') / qos.fps_scale)
+    except WebSocketDisconnect:
+        window.close()
+    finally:
+        source.renditions.unsubscribe(current)
+        source.supervisor.unsubscribe()
+
+async def send_dashboard(websocket, send_lock, source, window, mode, camera):
+    """Send a dashboard snapshot, then only what changed, one message per credit"""
+    previous = None
+    
+    try:
+        while await window.acquire():
+            while not window.closed:
+                dashboard = await asyncio.to_thread(build_dashboard, source, mode, camera)
+                if previous is None:
+                    message = {'channel': 'dashboard', 'type': 'snapshot', 'data': dashboard}
+                    break
+                # The timestamp alone is not worth a message
+                delta = json_delta({**previous, 'timestamp': None}, {**dashboard, 'timestamp': None})
+                if delta:
+                    delta['timestamp'] = dashboard['timestamp']
+                    message = {'channel': 'dashboard', 'type': 'delta', 'data': delta}
+                    break
+                await asyncio.sleep(DASHBOARD_PUSH_INTERVAL)
+            else:
+                return
+            
+            async with send_lock:
+                await websocket.send_json(message)
+            previous = dashboard
+            await asyncio.sleep(DASHBOARD_PUSH_INTERVAL)
+    except WebSocketDisconnect:
+        window.close()
+
+async def generate_mosaic():
+    """Stream the shared mosaic, every viewer yields the same encoded part
+
+    Async so that a client disconnect cancels it and releases the viewer.
+    """
+    mosaic.subscribe()
+    last_seq = 0
+    
+    try:
+        while True:
+            latest = await mosaic.wait_part(last_seq)
+            if latest is None:
+                continue
+            last_seq, part = latest
+            yield part
+    finally:
+        mosaic.unsubscribe()
+
+@app.get("/api/mosaic")
+async def stream_mosaic():
+    """All cameras in one MJPEG stream for video walls"""
     return StreamingResponse(
-        generate_frames(),
+        generate_mosaic(),
         media_type='multipart/x-mixed-replace; boundary=frame'
     )
 
+@app.websocket("/api/ws/video/{feed_type}")
+async def video_socket(websocket: WebSocket, feed_type: str, rendition: str = DEFAULT_RENDITION,
+                       camera: str = None, metadata: bool = False):
+    """Binary WebSocket video with client-driven flow control
+
+    The server sends a JSON hello with the rendition ids and frame layout,
+    then one length-prefixed binary message per frame, but only while the
+    client has granted credits: {"credits": n}. {"rendition": name}
+    switches rendition. Frames that arrive without credit are skipped, so
+    the client always gets the newest frame when it is ready for one.
+    """
+    await websocket.accept()
+    source = cameras.get(camera or DEFAULT_CAMERA)
+    if source is None or rendition not in RENDITION_LADDER:
+        await websocket.close(code=1008)
+        return
+    
+    windows = {feed_type: CreditWindow(WS_MAX_CREDITS)}
+    options = {feed_type: {'rendition': rendition, 'metadata': metadata}}
+    
+    await websocket.send_json({
+        'type': 'hello',
+        'camera': source.camera_id,
+        'channels': {feed_type: 0},
+        'renditions': list(RENDITION_LADDER),
+        'frame': frame_layout(),
+    })
+    
+    receiver = asyncio.create_task(receive_control(websocket, windows, options))
+    ws_stats['connections'] += 1
+    try:
+        await send_video(websocket, asyncio.Lock(), source, feed_type, 0,
+                         windows[feed_type], options[feed_type])
+    finally:
+        receiver.cancel()
+        ws_stats['connections'] -= 1
+        await close_socket(websocket, receiver)
+
+@app.websocket("/api/ws/tiles/{feed_type}")
+async def tiles_socket(websocket: WebSocket, feed_type: str, rendition: str = DEFAULT_RENDITION,
+                       camera: str = None):
+    """Tile-diff WebSocket video for cameras where little of the picture changes
+
+    Same hello, header and credits as /api/ws/video. Type 1 messages are
+    full keyframes; type 2 messages carry only changed tiles as
+    (column, row, length) entries followed by the tile JPEG, to be painted
+    over the previous picture at column * tileSize, row * tileSize.
+    """
+    await websocket.accept()
+    source = cameras.get(camera or DEFAULT_CAMERA)
+    if source is None or rendition not in RENDITION_LADDER:
+        await websocket.close(code=1008)
+        return
+    
+    windows = {feed_type: CreditWindow(WS_MAX_CREDITS)}
+    options = {feed_type: {'rendition': rendition}}
+    
+    await websocket.send_json({
+        'type': 'hello',
+        'camera': source.camera_id,
+        'channels': {feed_type: 0},
+        'renditions': list(RENDITION_LADDER),
+        'tileSize': TILE_SIZE,
+        'frame': frame_layout(),
+    })
+    
+    receiver = asyncio.create_task(receive_control(websocket, windows, options))
+    ws_stats['connections'] += 1
+    try:
+        await send_tiles(websocket, asyncio.Lock(), source, 0, windows[feed_type], options[feed_type])
+    finally:
+        receiver.cancel()
+        ws_stats['connections'] -= 1
+        await close_socket(websocket, receiver)
+
+@app.websocket("/api/ws/dashboard")
+async def dashboard_socket(websocket: WebSocket, rendition: str = DEFAULT_RENDITION,
+                           camera: str = None, mode: str = None, metadata: bool = False):
+    """Both feeds and dashboard updates multiplexed over one WebSocket
+
+    Channels are 'live' (0), 'manipulated' (1) and 'dashboard'. Video
+    channels send binary frames tagged with their channel id; the
+    dashboard channel sends a JSON snapshot and then JSON deltas. Every
+    channel has its own credit window: {"channel": name, "credits": n}.
+    """
+    await websocket.accept()
+    source = cameras.get(camera or DEFAULT_CAMERA)
+    if source is None or rendition not in RENDITION_LADDER:
+        await websocket.close(code=1008)
+        return
+    
+    feeds = ['live', 'manipulated']
+    windows = {name: CreditWindow(WS_MAX_CREDITS) for name in feeds + ['dashboard']}
+    options = {feed: {'rendition': rendition, 'metadata': metadata} for feed in feeds}
+    
+    await websocket.send_json({
+        'type': 'hello',
+        'camera': source.camera_id,
+        'channels': {**{feed: index for index, feed in enumerate(feeds)}, 'dashboard': None},
+        'renditions': list(RENDITION_LADDER),
+        'frame': frame_layout(),
+    })
+    
+    send_lock = asyncio.Lock()
+    receiver = asyncio.create_task(receive_control(websocket, windows, options))
+    ws_stats['connections'] += 1
+    try:
+        await asyncio.gather(
+            *[send_video(websocket, send_lock, source, feed, index, windows[feed], options[feed])
+              for index, feed in enumerate(feeds)],
+            send_dashboard(websocket, send_lock, source, windows['dashboard'], mode, camera),
+        )
+    finally:
+        receiver.cancel()
+        ws_stats['connections'] -= 1
+        await close_socket(websocket, receiver)
+
+@app.get("/api/segments/playlist.json")
+async def get_segment_playlist(camera: str = None):
+    """Rolling playlist of recent MP4 segments (low-bandwidth alternative to MJPEG)"""
+    source = get_source(camera)
+    source.segmenter.touch()
+    segments = source.segmenter.playlist()
+    query = f'?camera={source.camera_id}' if camera else ''
+    
+    return JSONResponse(
+        content={
+            'targetDuration': SEGMENT_SECONDS,
+            'mediaSequence': segments[0][0] if segments else 0,
+            # 'mp4v' segments (pip OpenCV builds) do not play in browsers
+            'codec': source.segmenter.codec,
+            'browserPlayable': source.segmenter.browser_playable,
+            'segments': [
+                {
+                    'sequence': sequence,
+                    'duration': duration,
+                    'url': f'http://localhost:8080/api/segments/{sequence}.mp4{query}',
+                }
+                for sequence, duration in segments
+            ],
+        },
+        headers={'Cache-Control': 'no-cache'}
+    )
+
+@app.get("/api/segments/{sequence}.mp4")
+async def get_segment(sequence: int, camera: str = None):
+    """Serve one MP4 segment from the rolling window"""
+    path = get_source(camera).segmenter.segment_path(sequence)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Segment not available")
+    
+    return FileResponse(
+        path,
+        media_type='video/mp4',
+        headers={'Cache-Control': 'public, max-age=3600, immutable'}
+    )
+
+@app.get("/api/portrait/{digest}.jpg")
+async def get_portrait(digest: str):
+    """Serve a cached portrait crop (content-addressed, never changes)"""
+    data = portrait_cache.get(digest)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Portrait not found")
+    
+    return Response(
+        content=data,
+        media_type='image/jpeg',
+        headers={
+            'Cache-Control': 'public, max-age=31536000, immutable',
+            'ETag': f'"{digest}"',
+        }
+    )
+
+@app.post("/api/jobs")
+async def submit_job(path: str, sample_fps: float = None):
+    """Queue offline face detection over a video file under BATCH_MEDIA_DIR"""
+    root = os.path.realpath(BATCH_MEDIA_DIR)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root:
+        raise HTTPException(status_code=400, detail="Path must be inside the media directory")
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail=f"File '{path}' not found")
+    if sample_fps is not None and sample_fps <= 0:
+        raise HTTPException(status_code=400, detail="sample_fps must be positive")
+    
+    job_id = jobs.submit(full_path, sample_fps)
+    return JSONResponse(
+        status_code=202,
+        content={
+            'jobId': job_id,
+            'statusUrl': f'http://localhost:8080/api/jobs/{job_id}',
+            'resultsUrl': f'http://localhost:8080/api/jobs/{job_id}/results',
+        }
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Progress of a batch job"""
+    status = jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+@app.get("/api/jobs/{job_id}/results")
+async def get_job_results(job_id: str):
+    """Per-frame detections of a finished batch job"""
+    status = jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status['status'] != 'done':
+        raise HTTPException(status_code=409, detail=f"Job is {status['status']}")
+    return JSONResponse(content=jobs.results(job_id))
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Pipeline metrics for comparing capture and streaming settings"""
+    capture = {}
+    for camera_id, source in cameras.items():
+        supervisor = source.supervisor
+        capture[camera_id] = {
+            'mode': supervisor.mode,
+            'state': supervisor.state,
+            'bufferSizeSupported': supervisor.buffer_size_supported,
+            'drainedFrames': supervisor.drained_frames,
+            'passthroughActive': supervisor.passthrough_active,
+            # Camera JPEGs sent unchanged, and passthrough frames decoded for pixels
+            'passedThrough': source.renditions.passed_through,
+            'decodedFrames': source.frame_hub.decoded_frames,
+            'subscribers': supervisor.subscribers,
+            'renditionSubscribers': source.renditions.subscriber_counts(),
+            'suspensions': supervisor.suspensions,
+            'openSeconds': supervisor.open_seconds and round(supervisor.open_seconds, 3),
+            'framePool': {
+                'allocated': source.frame_pool.allocated,
+                'reused': source.frame_pool.reused,
+            },
+            # Age of each frame when a viewer picks it up
+            'captureAgeMs': source.capture_age.snapshot(scale=1000),
+        }
+    
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'capture': capture,
+        # Effective per-stage rates per camera, after QoS and the budget
+        'sampling': {camera_id: source.scheduler.snapshot() for camera_id, source in cameras.items()},
+        'inference': {
+            'budgetFps': INFERENCE_BUDGET_FPS,
+            'minimumFps': INFERENCE_MIN_FPS,
+            'cameras': budget.snapshot(),
+        },
+        # Tiles run per detection pass in tiled mode, replayed detections for files
+        'detection': {
+            camera_id: {
+                'tiles': source.analytics.tiler and source.analytics.tiler.snapshot(),
+                'cache': source.analytics.detection_cache and source.analytics.detection_cache.snapshot(),
+            }
+            for camera_id, source in cameras.items()
+            if source.analytics is not None
+        },
+        # Per-detection recognition cache (hits skip the embedding) and best shots
+        'recognition': {
+            camera_id: {
+                'cache': source.analytics.recognition and source.analytics.recognition.snapshot(),
+                'bestShots': source.analytics.best_shots.snapshot(),
+            }
+            for camera_id, source in cameras.items()
+            if source.analytics is not None
+        },
+        'websocket': dict(ws_stats),
+        'mosaic': mosaic.snapshot(),
+        'qos': qos.snapshot(),
+    }
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "ok", "timestamp": datetime.now().isoformat()}
 
+@app.get("/ready")
+async def ready_check():
+    """Readiness endpoint, reports per-camera startup state"""
+    is_ready = readiness.is_ready()
+    states = readiness.snapshot()
+    
+    # Report the live connection state next to the startup state
+    for camera_id, source in cameras.items():
+        camera_state = states.get(camera_id)
+        if camera_state is not None:
+            camera_state['connection'] = source.supervisor.state
+            camera_state['reconnectAttempts'] = source.supervisor.attempts
+            camera_state['nextRetrySeconds'] = round(source.supervisor.next_retry_in, 2)
+    
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            'ready': is_ready,
+            'cameras': states,
+            'timestamp': datetime.now().isoformat(),
+        }
+    )
+
+def load_matcher():
+    """Load the target reference portrait, shared by every camera"""
+    try:
+        return TargetMatcher(TARGET_REFERENCE, TARGET_LABEL, detector=FaceDetector(),
+                             threshold=TARGET_MATCH_THRESHOLD)
+    except Exception as e:
+        print(f"⚠️  Target matching disabled: {e}")
+        return None
+
+def start_analytics(source, matcher):
+    """Load a face detector for the camera and start its pipeline"""
+    try:
+        # Cascade classifiers are not shared between threads
+        detector = FaceDetector()
+    except Exception as e:
+        print(f"⚠️  {source.camera_id}: analytics disabled, cannot load face detector: {e}")
+        return None
+    
+    tiler = TiledDetector(
+        detector,
+        tile_size=DETECTION_TILE_SIZE,
+        overlap=DETECTION_TILE_OVERLAP,
+        nms_threshold=DETECTION_NMS_IOU,
+    ) if DETECTION_MODE == 'tiled' else None
+    
+    detection_cache = None
+    if DETECTION_CACHE_ENABLED and not is_live_source(source.source):
+        try:
+            detection_cache = DetectionCache(
+                source.source,
+                (tiler or detector).version,
+                directory=DETECTION_CACHE_DIR,
+                tolerance=DETECTION_CACHE_TOLERANCE,
+            )
+        except OSError as e:
+            print(f"⚠️  {source.camera_id}: detection cache disabled: {e}")
+    
+    pipeline = AnalyticsPipeline(
+        source.camera_id,
+        source.frame_hub,
+        source.supervisor,
+        source.scheduler,
+        source.change_detector,
+        detector,
+        DetectionTracker(prefix='d-live'),
+        matcher,
+        tiler=tiler,
+        detection_cache=detection_cache,
+        recognition=RecognitionCache(
+            matcher,
+            ttl=RECOGNITION_TTL_SECONDS,
+            quality_gain=RECOGNITION_QUALITY_GAIN,
+            min_iou=RECOGNITION_MIN_IOU,
+        ) if matcher is not None else None,
+        best_shots=BestShotBuffer(
+            size=BEST_SHOTS_PER_DETECTION,
+            min_quality=BEST_SHOT_MIN_QUALITY,
+            max_age=BEST_SHOT_MAX_AGE_SECONDS,
+            portrait=source.portraits.crop,
+        ),
+        budget=budget,
+        motion_hold=MOTION_HOLD_SECONDS,
+    )
+    pipeline.start()
+    source.analytics = pipeline
+    return detector
+
+def warm_up_camera(source, matcher):
+    """Start analytics, wait for the supervisor to connect, read a first frame and prime the encoder"""
+    camera_id = source.camera_id
+    
+    try:
+        detector = start_analytics(source, matcher) if ANALYTICS_ENABLED else None
+        
+        # Pull one frame through the shared hub and encode it once, so the
+        # first viewer does not pay for codec initialisation. The supervisor
+        # keeps retrying with backoff, readiness stays 'starting' until then
+        source.supervisor.subscribe()
+        try:
+            latest = None
+            while latest is None:
+                latest = source.frame_hub.next_frame(0, lease=True)
+            try:
+                source.renditions.encode(DEFAULT_RENDITION, latest[1], latest[0])
+                if detector is not None:
+                    detector.detect(latest[1])
+            finally:
+                source.frame_hub.release(latest[1])
+        finally:
+            source.supervisor.unsubscribe()
+        
+        readiness.set(camera_id, 'ready')
+        print(f"✅ {camera_id}: camera ready")
+    except Exception as e:
+        readiness.set(camera_id, 'failed', str(e))
+        print(f"Error warming up camera {camera_id}: {e}")
+
+def warm_up():
+    """Load shared models, then warm up every camera in parallel"""
+    matcher = load_matcher() if ANALYTICS_ENABLED and TARGET_MATCHING_ENABLED else None
+    
+    for source in cameras.values():
+        threading.Thread(target=warm_up_camera, args=(source, matcher),
+                         name=f'{source.camera_id}-warmup', daemon=True).start()
+
+@app.on_event("startup")
+async def startup_event():
+    """Start device opening and warmup without blocking the server"""
+    for source in cameras.values():
+        readiness.set(source.camera_id, 'starting')
+        source.supervisor.start()
+    
+    # Model loading overlaps with the supervisors opening their devices
+    threading.Thread(target=warm_up, name='warmup', daemon=True).start()
+    qos.start()
+    asyncio.create_task(qos.watch_loop_lag())
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
-    global camera
-    if camera is not None:
-        camera.release()
-        print("\n📹 Camera released")
+    qos.stop()
+    jobs.shutdown()
+    for source in cameras.values():
+        source.segmenter.close()
+        if source.analytics is not None:
+            source.analytics.stop()
+            if source.analytics.detection_cache is not None:
+                source.analytics.detection_cache.save()
+        source.supervisor.stop()
+    print("\n📹 Cameras released")
 
 if __name__ == "__main__":
     import uvicorn
@@ -288,22 +1316,13 @@ if __name__ == "__main__":
     print("=" * 60)
     print("INTAI Backend Server (FastAPI + Uvicorn)")
     print("=" * 60)
+    print(f"📷 Cameras: {', '.join(cameras)} (default: {DEFAULT_CAMERA})")
     
     if USE_WEBCAM:
         print(f"📹 Mode: WEBCAM (Camera Index: {CAMERA_INDEX})")
         print(f"   Attempting to use camera at index {CAMERA_INDEX}")
         print(f"   Change CAMERA_INDEX in main.py if you have multiple cameras")
-        
-        # Test camera access
-        test_cam = cv2.VideoCapture(CAMERA_INDEX)
-        if test_cam.isOpened():
-            print("   ✅ Camera detected and accessible")
-            test_cam.release()
-        else:
-            print("   ⚠️  WARNING: Cannot access camera!")
-            print("   - Check if another application is using the camera")
-            print("   - Try a different CAMERA_INDEX (0, 1, 2, etc.)")
-            print("   - Or set USE_WEBCAM = False to use a video file")
+        print(f"   The camera opens in the background, check /ready for its status")
     else:
         print(f"📁 Mode: VIDEO FILE")
         import os
@@ -318,7 +1337,10 @@ if __name__ == "__main__":
     print("🌐 Server starting...")
     print(f"   API: http://localhost:8080/api/dashboard")
     print(f"   Video: http://localhost:8080/api/video/live")
+    print(f"   Segments: http://localhost:8080/api/segments/playlist.json")
+    print(f"   Metrics: http://localhost:8080/api/metrics")
     print(f"   Health: http://localhost:8080/health")
+    print(f"   Ready: http://localhost:8080/ready")
     print(f"   Docs: http://localhost:8080/docs")
     print()
     print("Press Ctrl+C to stop")
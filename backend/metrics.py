@@ -0,0 +1,44 @@
+import threading
+import time
+from collections import deque
+
+
+class RollingStats:
+    """Summary statistics over the last N observations
+
+    With max_age, observations older than that many seconds are dropped
+    too, so the stats go empty once nothing is being observed.
+    """
+
+    def __init__(self, size=300, max_age=None):
+        self.max_age = max_age
+        # (time.monotonic(), value) pairs
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._values.append((time.monotonic(), value))
+
+    def snapshot(self, scale=1.0, digits=1):
+        """Return count/mean/p50/p95/max, multiplied by scale"""
+        with self._lock:
+            if self.max_age is not None:
+                cutoff = time.monotonic() - self.max_age
+                while self._values and self._values[0][0] < cutoff:
+                    self._values.popleft()
+            values = sorted(value for _, value in self._values)
+
+        if not values:
+            return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'max': None}
+
+        def pick(q):
+            return round(values[min(len(values) - 1, int(q * len(values)))] * scale, digits)
+
+        return {
+            'count': len(values),
+            'mean': round(sum(values) / len(values) * scale, digits),
+            'p50': pick(0.50),
+            'p95': pick(0.95),
+            'max': round(values[-1] * scale, digits),
+        }
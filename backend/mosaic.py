@@ -0,0 +1,157 @@
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from renditions import multipart_part
+from waiters import AsyncWaiters
+
+
+class MosaicComposer:
+    """Compose every camera into one grid, encoded once for all wall viewers
+
+    The canvas is kept between ticks and a tile is only redrawn when its
+    camera published a new frame (or went offline), so an idle wall costs
+    nothing but the frame id checks. The thread runs only while someone
+    watches.
+    """
+
+    def __init__(self, sources, tile_size=(320, 180), fps=10, quality=75, idle_grace=5.0):
+        self.sources = list(sources)
+        self.tile_width, self.tile_height = tile_size
+        self.interval = 1.0 / fps
+        self.quality = quality
+        self.idle_grace = idle_grace
+
+        self.columns = max(1, math.ceil(math.sqrt(len(self.sources))))
+        self.rows = max(1, math.ceil(len(self.sources) / self.columns))
+        self.canvas = np.zeros((self.rows * self.tile_height, self.columns * self.tile_width, 3),
+                               dtype=np.uint8)
+
+        self.viewers = 0
+        self.tiles_updated = 0
+        self.encodes = 0
+        self.idle_ticks = 0
+        # (seq, multipart part) swapped as one tuple
+        self._latest = (0, None)
+        self._drawn = [None] * len(self.sources)
+        self._cond = threading.Condition()
+        self._async_waiters = AsyncWaiters()
+        self._thread = None
+        self._idle_since = time.monotonic()
+
+    def subscribe(self):
+        with self._cond:
+            self.viewers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='mosaic', daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self):
+        with self._cond:
+            self.viewers = max(0, self.viewers - 1)
+            if self.viewers == 0:
+                self._idle_since = time.monotonic()
+
+    def next_part(self, last_seq, timeout=1.0):
+        """Wait for a mosaic newer than last_seq; returns (seq, part) or None"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest[0] > last_seq, timeout):
+                return None
+            return self._latest
+
+    async def wait_part(self, last_seq, timeout=1.0):
+        """next_part() for coroutines, waiting on the event loop"""
+        if not await self._async_waiters.wait_for(lambda: self._latest[0] > last_seq, timeout):
+            return None
+        return self._latest
+
+    def snapshot(self):
+        return {
+            'viewers': self.viewers,
+            'grid': [self.columns, self.rows],
+            'tilesUpdated': self.tiles_updated,
+            'encodes': self.encodes,
+            'idleTicks': self.idle_ticks,
+        }
+
+    def _run(self):
+        for source in self.sources:
+            source.supervisor.subscribe()
+        try:
+            while True:
+                with self._cond:
+                    if self.viewers == 0 and time.monotonic() - self._idle_since >= self.idle_grace:
+                        self._thread = None
+                        return
+
+                started = time.monotonic()
+                try:
+                    if self.tick():
+                        self._encode()
+                    else:
+                        self.idle_ticks += 1
+                except Exception as e:
+                    print(f"Error in mosaic: {e}")
+                time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+        finally:
+            for source in self.sources:
+                source.supervisor.unsubscribe()
+
+    def tick(self):
+        """Redraw tiles whose camera has a new frame; True if any changed"""
+        changed = False
+        for index, source in enumerate(self.sources):
+            if source.supervisor.is_online():
+                frame_id, frame, _ = source.frame_hub.latest(decode=False)
+                key = frame_id if frame_id else 'offline'
+            else:
+                frame, key = None, 'offline'
+
+            if key == self._drawn[index]:
+                continue
+            if key != 'offline':
+                # Leased (and for passthrough decoded) only when the tile is redrawn
+                frame_id, frame, _ = source.frame_hub.latest(lease=True)
+                key = frame_id if frame is not None else 'offline'
+            try:
+                self._draw(index, source, frame)
+            finally:
+                source.frame_hub.release(frame)
+            self._drawn[index] = key
+            self.tiles_updated += 1
+            changed = True
+        return changed
+
+    def _draw(self, index, source, frame):
+        x0 = (index % self.columns) * self.tile_width
+        y0 = (index // self.columns) * self.tile_height
+        tile = self.canvas[y0:y0 + self.tile_height, x0:x0 + self.tile_width]
+        tile[:] = 0
+
+        if frame is not None:
+            # Fit inside the tile, keeping the aspect ratio
+            height, width = frame.shape[:2]
+            scale = min(self.tile_width / width, self.tile_height / height)
+            w, h = max(1, int(width * scale)), max(1, int(height * scale))
+            ox, oy = (self.tile_width - w) // 2, (self.tile_height - h) // 2
+            tile[oy:oy + h, ox:ox + w] = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+        else:
+            cv2.putText(tile, 'OFFLINE', (self.tile_width // 2 - 45, self.tile_height // 2),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (80, 80, 80), 1, cv2.LINE_AA)
+
+        cv2.putText(tile, source.config.get('cameraName', source.camera_id), (6, 16),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1, cv2.LINE_AA)
+
+    def _encode(self):
+        ret, buffer = cv2.imencode('.jpg', self.canvas, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ret:
+            return
+        part = multipart_part(buffer)
+        self.encodes += 1
+        with self._cond:
+            self._latest = (self._latest[0] + 1, part)
+            self._cond.notify_all()
+        self._async_waiters.notify_all()
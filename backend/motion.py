@@ -0,0 +1,53 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class ChangeDetector:
+    """Cheap scene-change test on downscaled grayscale thumbnails"""
+
+    def __init__(self, size=(64, 36), pixel_threshold=12, area_threshold=0.002):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self._cached = (0, None)
+        self._lock = threading.Lock()
+
+    def thumbnail(self, frame_id, frame):
+        """Return the thumbnail of a frame, computed once per frame_id"""
+        with self._lock:
+            if self._cached[0] == frame_id and self._cached[1] is not None:
+                return self._cached[1]
+
+            small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+            if small.ndim == 3:
+                small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+            self._cached = (frame_id, small)
+            return small
+
+    def jpeg_thumbnail(self, frame_id, jpeg):
+        """Thumbnail of an undecoded JPEG, from a 1/8-scale grayscale decode"""
+        with self._lock:
+            if self._cached[0] == frame_id and self._cached[1] is not None:
+                return self._cached[1]
+
+        reduced = cv2.imdecode(jpeg, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if reduced is None:
+            return None
+        return self.thumbnail(frame_id, reduced)
+
+    def changed(self, previous, current):
+        """True if enough thumbnail pixels moved beyond sensor noise"""
+        return self.significant(self.moved(previous, current))
+
+    def moved(self, previous, current):
+        """Boolean thumbnail-sized mask of pixels that moved beyond sensor noise"""
+        if previous is None or previous.shape != current.shape:
+            return np.ones(current.shape[:2], dtype=bool)
+        return cv2.absdiff(previous, current) > self.pixel_threshold
+
+    def significant(self, mask):
+        """True if a moved mask covers enough of the thumbnail"""
+        return np.count_nonzero(mask) > self.area_threshold * mask.size
@@ -0,0 +1,110 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+
+
+class PortraitCache:
+    """Size-bounded LRU cache of encoded portraits keyed by content hash"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, data):
+        """Store encoded bytes and return their content digest"""
+        digest = hashlib.sha1(data).hexdigest()[:16]
+
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                return digest
+
+            self._entries[digest] = data
+            self._size += len(data)
+
+            # Evict least recently used entries, but always keep the newest
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+        return digest
+
+    def get(self, digest):
+        """Return cached bytes for a digest, or None if evicted"""
+        with self._lock:
+            data = self._entries.get(digest)
+            if data is not None:
+                self._entries.move_to_end(digest)
+            return data
+
+
+class PortraitExtractor:
+    """Crop the target's face from a frame and encode it once per change"""
+
+    def __init__(self, cache, size=200, padding=0.15, quality=90):
+        self.cache = cache
+        self.size = size
+        self.padding = padding
+        self.quality = quality
+        self._last_key = None
+        self._last_digest = None
+        self._lock = threading.Lock()
+
+    def extract(self, frame, frame_id, bbox):
+        """Return the digest of the portrait for a normalized bbox in frame"""
+        # Same frame and same box means the same crop, so skip the encode
+        key = (frame_id, round(bbox['x'], 3), round(bbox['y'], 3),
+               round(bbox['w'], 3), round(bbox['h'], 3))
+
+        with self._lock:
+            if key == self._last_key and self.cache.get(self._last_digest) is not None:
+                return self._last_digest
+
+            crop = self.crop(frame, bbox)
+            if crop is None:
+                return None
+
+            return self._encode(crop, key)
+
+    def extract_shot(self, detection_id, shot):
+        """Return the digest of a best shot's pre-cut portrait crop"""
+        if shot is None or shot['portrait'] is None:
+            return None
+
+        key = (detection_id, shot['frameId'])
+        with self._lock:
+            if key == self._last_key and self.cache.get(self._last_digest) is not None:
+                return self._last_digest
+            return self._encode(shot['portrait'], key)
+
+    def _encode(self, crop, key):
+        ret, buffer = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ret:
+            return None
+
+        self._last_key = key
+        self._last_digest = self.cache.put(buffer.tobytes())
+        return self._last_digest
+
+    def crop(self, frame, bbox):
+        """Cut a padded square around the bbox and resize to portrait size"""
+        height, width = frame.shape[:2]
+
+        cx = (bbox['x'] + bbox['w'] / 2) * width
+        cy = (bbox['y'] + bbox['h'] / 2) * height
+        side = max(bbox['w'] * width, bbox['h'] * height) * (1 + 2 * self.padding)
+
+        x0 = int(max(0, cx - side / 2))
+        y0 = int(max(0, cy - side / 2))
+        x1 = int(min(width, cx + side / 2))
+        y1 = int(min(height, cy + side / 2))
+
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+
+        return cv2.resize(frame[y0:y1, x0:x1], (self.size, self.size),
+                          interpolation=cv2.INTER_AREA)
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+# Load is shed top to bottom: analytics rate first, then rendition quality
+# and resolution (rungs down the ladder), then stream fps
+DEFAULT_LEVELS = [
+    {'analyticsScale': 1.0, 'renditionShift': 0, 'fpsScale': 1.0},
+    {'analyticsScale': 0.5, 'renditionShift': 0, 'fpsScale': 1.0},
+    {'analyticsScale': 0.25, 'renditionShift': 0, 'fpsScale': 1.0},
+    {'analyticsScale': 0.25, 'renditionShift': 1, 'fpsScale': 1.0},
+    {'analyticsScale': 0.25, 'renditionShift': 2, 'fpsScale': 1.0},
+    {'analyticsScale': 0.25, 'renditionShift': 2, 'fpsScale': 0.5},
+    {'analyticsScale': 0.25, 'renditionShift': 2, 'fpsScale': 0.25},
+]
+
+
+class ProcessCpu:
+    """This process's CPU use since the previous call, per core (1.0 means every core is busy)
+
+    Measured from process_time() deltas, so it reacts within one QoS tick
+    and ignores other processes on the host, unlike the load average.
+    """
+
+    def __init__(self):
+        self._last = (time.monotonic(), time.process_time())
+
+    def __call__(self):
+        now, cpu = time.monotonic(), time.process_time()
+        last_now, last_cpu = self._last
+        self._last = (now, cpu)
+        if now - last_now <= 0:
+            return None
+        return (cpu - last_cpu) / (now - last_now) / (os.cpu_count() or 1)
+
+
+class QosController:
+    """Step through degradation levels as the host runs out of headroom
+
+    Each probe returns a number with a high and a low watermark. Any probe
+    above its high mark for `degrade_after` ticks sheds one level; all probes
+    below their low marks for `restore_after` ticks restores one level.
+    """
+
+    def __init__(self, levels=None, interval=1.0, degrade_after=3, restore_after=10, history=50):
+        self.levels = levels or DEFAULT_LEVELS
+        self.interval = interval
+        self.degrade_after = degrade_after
+        self.restore_after = restore_after
+
+        self.level = 0
+        self.loop_lag = 0.0
+        self.signals = {}
+        self.decisions = deque(maxlen=history)
+        self._probes = {}
+        self._pressure_ticks = 0
+        self._headroom_ticks = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    @property
+    def analytics_scale(self):
+        return self.settings['analyticsScale']
+
+    @property
+    def rendition_shift(self):
+        return self.settings['renditionShift']
+
+    @property
+    def fps_scale(self):
+        return self.settings['fpsScale']
+
+    def add_probe(self, name, read, high, low):
+        """Register a signal; read() is called once per tick"""
+        self._probes[name] = (read, high, low)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='qos', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    async def watch_loop_lag(self, interval=0.25):
+        """Measure how late the event loop wakes up from a short sleep"""
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, loop.time() - started - interval)
+
+    def snapshot(self):
+        return {
+            'level': self.level,
+            'maxLevel': len(self.levels) - 1,
+            'settings': dict(self.settings),
+            'signals': dict(self.signals),
+            'decisions': list(self.decisions),
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Error in QoS controller: {e}")
+
+    def tick(self):
+        pressured = []
+        relaxed = True
+        signals = {}
+
+        for name, (read, high, low) in self._probes.items():
+            value = read()
+            if value is None:
+                continue
+            signals[name] = round(value, 3)
+            if value > high:
+                pressured.append(name)
+            if value > low:
+                relaxed = False
+
+        self.signals = signals
+
+        if pressured:
+            self._headroom_ticks = 0
+            self._pressure_ticks += 1
+            if self._pressure_ticks >= self.degrade_after and self.level < len(self.levels) - 1:
+                self._change(self.level + 1, 'pressure: ' + ', '.join(pressured))
+        elif relaxed:
+            self._pressure_ticks = 0
+            self._headroom_ticks += 1
+            if self._headroom_ticks >= self.restore_after and self.level > 0:
+                self._change(self.level - 1, 'headroom')
+        else:
+            # Between watermarks: hold the current level
+            self._pressure_ticks = 0
+            self._headroom_ticks = 0
+
+    def _change(self, level, reason):
+        self.decisions.append({
+            'timestamp': datetime.now().isoformat(),
+            'from': self.level,
+            'to': level,
+            'reason': reason,
+            'signals': dict(self.signals),
+            'settings': dict(self.levels[level]),
+        })
+        print(f"⚙️  QoS level {self.level} -> {level} ({reason})")
+        self.level = level
+        self._pressure_ticks = 0
+        self._headroom_ticks = 0
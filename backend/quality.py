@@ -0,0 +1,110 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from recognition import crop_box
+
+
+def face_quality(face, sharpness_knee=100.0, full_size=96):
+    """Cheap 0-1 quality of a face crop from sharpness, size and exposure"""
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY) if face.ndim == 3 else face
+
+    # Laplacian variance is high for crisp edges and low for blur
+    variance = cv2.Laplacian(gray, cv2.CV_32F).var()
+    sharpness = variance / (variance + sharpness_knee)
+
+    size = min(1.0, min(gray.shape[:2]) / full_size)
+
+    # Mid-grey scores best, crushed or blown out pixels are penalised
+    mean = float(gray.mean())
+    clipped = np.count_nonzero((gray < 8) | (gray > 247)) / gray.size
+    exposure = max(0.0, 1.0 - abs(mean - 128.0) / 128.0 - clipped)
+
+    return float((sharpness * size * exposure) ** (1.0 / 3.0))
+
+
+class BestShotBuffer:
+    """Keep the highest quality crops of every tracked detection id
+
+    Crops are offered as detections come in; only the top `size` per id,
+    no older than `max_age`, are kept for recognition and the portrait.
+    """
+
+    def __init__(self, size=3, min_quality=0.35, max_age=10.0, portrait=None):
+        self.size = size
+        self.min_quality = min_quality
+        self.max_age = max_age
+        # portrait(frame, bbox) cuts the padded portrait crop of an accepted shot
+        self.portrait = portrait
+        self.offered = 0
+        self.accepted = 0
+        self.rejected = 0
+        self._shots = {}
+        self._lock = threading.Lock()
+
+    def offer(self, detection_id, frame, frame_id, box, now=None):
+        """Score the crop of a detection and keep it if it is a top shot"""
+        now = time.monotonic() if now is None else now
+        face = crop_box(frame, box)
+        if face is None:
+            return False
+
+        quality = face_quality(face)
+        with self._lock:
+            self.offered += 1
+            shots = [s for s in self._shots.get(detection_id, []) if now - s['at'] <= self.max_age]
+            self._shots[detection_id] = shots
+            if quality < self.min_quality or (
+                    len(shots) >= self.size and quality <= shots[-1]['quality']):
+                self.rejected += 1
+                return False
+
+        # Copy out of the pooled frame, it is reused once the hub moves on
+        shot = {
+            'quality': quality,
+            'face': face.copy(),
+            'portrait': self._portrait(frame, box),
+            'box': tuple(box),
+            'frameId': frame_id,
+            'at': now,
+        }
+        with self._lock:
+            self.accepted += 1
+            shots = self._shots.setdefault(detection_id, [])
+            shots.append(shot)
+            shots.sort(key=lambda s: s['quality'], reverse=True)
+            del shots[self.size:]
+        return True
+
+    def best(self, detection_id):
+        """The best current shot of a detection, or None"""
+        with self._lock:
+            shots = self._shots.get(detection_id)
+            return shots[0] if shots else None
+
+    def retain(self, detection_ids):
+        """Drop shots of detections that are no longer tracked"""
+        with self._lock:
+            for detection_id in [d for d in self._shots if d not in detection_ids]:
+                del self._shots[detection_id]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'tracked': len(self._shots),
+                'offered': self.offered,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'bestQuality': {
+                    detection_id: round(shots[0]['quality'], 3)
+                    for detection_id, shots in self._shots.items() if shots
+                },
+            }
+
+    def _portrait(self, frame, box):
+        if self.portrait is None:
+            return None
+        x, y, w, h = box
+        return self.portrait(frame, {'x': x, 'y': y, 'w': w, 'h': h})
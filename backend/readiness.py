@@ -0,0 +1,30 @@
+import threading
+import time
+
+
+class ReadinessTracker:
+    """Track background startup of each camera for the /ready endpoint"""
+
+    def __init__(self):
+        self._started = time.monotonic()
+        self._cameras = {}
+        self._lock = threading.Lock()
+
+    def set(self, camera_id, status, error=None):
+        """Record a camera's status: 'starting', 'ready' or 'failed'"""
+        with self._lock:
+            self._cameras[camera_id] = {
+                'status': status,
+                'error': error,
+                'sinceStartMs': int((time.monotonic() - self._started) * 1000),
+            }
+
+    def snapshot(self):
+        with self._lock:
+            return {camera_id: dict(state) for camera_id, state in self._cameras.items()}
+
+    def is_ready(self):
+        with self._lock:
+            return bool(self._cameras) and all(
+                state['status'] == 'ready' for state in self._cameras.values()
+            )
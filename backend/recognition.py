@@ -0,0 +1,137 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from detection import box_tuple, iou
+
+
+def face_embedding(face, size=32):
+    """Zero-mean, unit-norm vector of an equalized grayscale face crop"""
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY) if face.ndim == 3 else face
+    gray = cv2.equalizeHist(cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA))
+
+    vector = gray.astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def crop_box(frame, box):
+    """Cut a normalized (x, y, w, h) box out of a frame, or None if empty"""
+    height, width = frame.shape[:2]
+    x0 = int(max(0, box[0] * width))
+    y0 = int(max(0, box[1] * height))
+    x1 = int(min(width, (box[0] + box[2]) * width))
+    y1 = int(min(height, (box[1] + box[3]) * height))
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return None
+    return frame[y0:y1, x0:x1]
+
+
+class TargetMatcher:
+    """Match face crops against the reference portrait of the target
+
+    The score is a correlation of small equalized grayscale crops. It is
+    a placeholder for a real face embedding model and does not establish
+    identity.
+    """
+
+    def __init__(self, reference_path, label, detector=None, threshold=0.5):
+        self.label = label
+        self.threshold = threshold
+
+        reference = cv2.imread(reference_path)
+        if reference is None:
+            raise RuntimeError(f"Could not read reference portrait '{reference_path}'")
+
+        # Use the face inside the reference portrait if the detector finds one
+        face = reference
+        if detector is not None:
+            faces = detector.detect(reference)
+            if len(faces):
+                best = faces[np.argmax(faces['w'] * faces['h'])]
+                face = crop_box(reference, box_tuple(best))
+        self.reference = face_embedding(face)
+
+    def score(self, face):
+        """Similarity of a face crop to the target, 0-1"""
+        return self.similarity(face_embedding(face))
+
+    def similarity(self, embedding):
+        return max(0.0, float(np.dot(self.reference, embedding)))
+
+
+class RecognitionCache:
+    """Remember the embedding and target score of each tracked detection id
+
+    A tracked face keeps its id across frames, so it only needs to be
+    recognised again when the crop gets noticeably better, the box moves
+    or resizes a lot, or the cached result is older than `ttl`. Quality
+    defaults to the crop area when no quality score is given.
+    """
+
+    def __init__(self, matcher, ttl=5.0, quality_gain=0.25, min_iou=0.5):
+        self.matcher = matcher
+        self.ttl = ttl
+        self.quality_gain = quality_gain
+        self.min_iou = min_iou
+        self.hits = 0
+        self.misses = 0
+        self.reasons = {'new': 0, 'quality': 0, 'box': 0, 'ttl': 0}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def score(self, detection_id, box, face, quality=None, now=None):
+        """Target score for a detection, recomputed only when it is stale"""
+        now = time.monotonic() if now is None else now
+        quality = face.shape[0] * face.shape[1] if quality is None else quality
+
+        entry = self._entries.get(detection_id)
+        reason = self._stale(entry, box, quality, now)
+        if reason is None:
+            with self._lock:
+                self.hits += 1
+            return entry['score']
+
+        embedding = face_embedding(face)
+        score = self.matcher.similarity(embedding)
+        self._entries[detection_id] = {
+            'embedding': embedding,
+            'score': score,
+            'box': tuple(box),
+            'quality': quality,
+            'at': now,
+        }
+        with self._lock:
+            self.misses += 1
+            self.reasons[reason] += 1
+        return score
+
+    def _stale(self, entry, box, quality, now):
+        if entry is None:
+            return 'new'
+        if quality > entry['quality'] * (1.0 + self.quality_gain):
+            return 'quality'
+        if iou(entry['box'], box) < self.min_iou:
+            return 'box'
+        if now - entry['at'] > self.ttl:
+            return 'ttl'
+        return None
+
+    def retain(self, detection_ids):
+        """Drop entries for detections that are no longer tracked"""
+        for detection_id in [d for d in self._entries if d not in detection_ids]:
+            del self._entries[detection_id]
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else None,
+                'recomputeReasons': dict(self.reasons),
+            }
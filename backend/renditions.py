@@ -0,0 +1,136 @@
+import json
+import threading
+
+import cv2
+
+
+MULTIPART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+MULTIPART_TRAILER = b'\r\n'
+
+
+def multipart_part(jpeg):
+    """Frame encoded JPEG data as one multipart/x-mixed-replace part
+
+    Starlette's StreamingResponse only accepts bytes, so the part is built
+    with a single join over the encoder's buffer instead of tobytes() plus
+    two concatenations.
+    """
+    return b''.join((MULTIPART_HEADER, memoryview(jpeg), MULTIPART_TRAILER))
+
+
+def metadata_header(metadata, length):
+    """Multipart part header carrying a frame's metadata next to its JPEG
+
+    The JPEG itself follows as the shared RenditionEncoder.body() bytes, so
+    only this header is built per viewer.
+    """
+    return (
+        b'--frame\r\n'
+        b'Content-Type: image/jpeg\r\n'
+        + f'Content-Length: {length}\r\n'
+          f'X-Frame-Seq: {metadata["seq"]}\r\n'
+          f'X-Capture-Time: {metadata["capturedAt"]}\r\n'
+          f'X-Frame-Metadata: {json.dumps(metadata, separators=(",", ":"))}\r\n\r\n'.encode()
+    )
+
+
+def scale_to_height(frame, height):
+    """Downscale frame to the target height, keeping the aspect ratio"""
+    src_height, src_width = frame.shape[:2]
+    if src_height <= height:
+        return frame
+
+    width = int(round(src_width * height / src_height)) & ~1
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class RenditionEncoder:
+    """Encode each frame at most once per rendition, only while it is watched
+
+    When the camera's own JPEG is passed in and already fits a rendition,
+    it is forwarded unchanged instead of being re-encoded.
+    """
+
+    def __init__(self, ladder):
+        self.ladder = ladder
+        self._subscribers = {name: 0 for name in ladder}
+        self._encoded = {}
+        # (frame_id, JPEG + trailer bytes) for viewers that frame parts themselves
+        self._bodies = {}
+        self._locks = {name: threading.Lock() for name in ladder}
+        self._count_lock = threading.Lock()
+        self.passed_through = 0
+
+    def subscribe(self, name):
+        with self._count_lock:
+            self._subscribers[name] += 1
+
+    def unsubscribe(self, name):
+        with self._count_lock:
+            self._subscribers[name] -= 1
+            if self._subscribers[name] <= 0:
+                self._subscribers[name] = 0
+                # Nobody is watching, drop the last encoded frame
+                self._encoded.pop(name, None)
+                self._bodies.pop(name, None)
+
+    def subscriber_counts(self):
+        with self._count_lock:
+            return dict(self._subscribers)
+
+    def encode(self, name, frame, frame_id, jpeg=None, source_height=None):
+        """Return the JPEG of frame at the given rendition (a bytes-like view)"""
+        entry = self._entry(name, frame, frame_id, jpeg, source_height)
+        return None if entry is None else memoryview(entry[1])
+
+    def multipart(self, name, frame, frame_id, jpeg=None, source_height=None):
+        """Return the framed multipart part, built once and shared by all viewers"""
+        entry = self._entry(name, frame, frame_id, jpeg, source_height)
+        return None if entry is None else entry[2]
+
+    def passes_through(self, name, source_height):
+        """True if a camera JPEG of this height can be sent as the rendition"""
+        return source_height is not None and source_height <= self.ladder[name]['height']
+
+    def body(self, name, frame, frame_id, jpeg=None, source_height=None):
+        """Return the JPEG followed by the part trailer, built once per frame"""
+        entry = self._entry(name, frame, frame_id, jpeg, source_height)
+        if entry is None:
+            return None
+
+        with self._locks[name]:
+            cached = self._bodies.get(name)
+            if cached is not None and cached[0] == frame_id:
+                return cached[1]
+            body = b''.join((memoryview(entry[1]), MULTIPART_TRAILER))
+            if self._subscribers[name] > 0:
+                self._bodies[name] = (frame_id, body)
+            return body
+
+    def _entry(self, name, frame, frame_id, jpeg=None, source_height=None):
+        with self._locks[name]:
+            cached = self._encoded.get(name)
+            if cached is not None and cached[0] == frame_id:
+                return cached
+
+            if jpeg is not None and self.passes_through(name, source_height):
+                entry = (frame_id, jpeg, multipart_part(jpeg))
+                self.passed_through += 1
+                if self._subscribers[name] > 0:
+                    self._encoded[name] = entry
+                return entry
+            if frame is None:
+                return None
+
+            spec = self.ladder[name]
+            ret, buffer = cv2.imencode('.jpg', scale_to_height(frame, spec['height']),
+                                       [cv2.IMWRITE_JPEG_QUALITY, spec['quality']])
+            if not ret:
+                return None
+
+            # imencode allocates a fresh buffer every call, encoded bytes are
+            # not pooled; keeping it only avoids one extra tobytes() copy
+            entry = (frame_id, buffer, multipart_part(buffer))
+            if self._subscribers[name] > 0:
+                self._encoded[name] = entry
+            return entry
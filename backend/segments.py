@@ -0,0 +1,188 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from renditions import scale_to_height
+
+
+class Segmenter:
+    """Write short MP4 segments from the frame hub and keep a rolling window
+
+    OpenCV's VideoWriter cannot emit fragmented MP4, so each segment is a
+    short self-contained MP4 that a player can fetch and play in sequence.
+    The writer thread only runs while the playlist is being polled.
+
+    Browsers only play H.264 ('avc1'). The opencv-python wheels ship
+    without an H.264 encoder, so there the segments are MPEG-4 Part 2
+    ('mp4v'): fine for VLC or ffplay, not for a <video> element.
+    """
+
+    FOURCC_PREFERENCE = ('avc1', 'mp4v')
+    BROWSER_CODECS = ('avc1',)
+    # Picked on the first segment and shared by every camera: probing a
+    # missing encoder logs an FFmpeg error each time
+    _fourcc = None
+    _fourcc_lock = threading.Lock()
+
+    def __init__(self, frame_hub, supervisor, directory=None, segment_seconds=2.0, window=6,
+                 fps=15, height=720, idle_seconds=30.0):
+        self.frame_hub = frame_hub
+        self.supervisor = supervisor
+        # A temporary directory is only created once segments are requested
+        self.directory = directory
+        self._owns_directory = directory is None
+        self.segment_seconds = segment_seconds
+        self.window = window
+        self.fps = fps
+        self.height = height
+        self.idle_seconds = idle_seconds
+
+        self._segments = deque()
+        self._next_sequence = 0
+        self._last_request = 0.0
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def touch(self):
+        """Record a playlist request and start the writer if it is idle"""
+        with self._lock:
+            if self._closed:
+                return
+            self._last_request = time.monotonic()
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix='intai-segments-')
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='segmenter', daemon=True)
+                self._thread.start()
+
+    @property
+    def codec(self):
+        """Fourcc the segments are written with, None until the first one"""
+        return Segmenter._fourcc
+
+    @property
+    def browser_playable(self):
+        return None if self.codec is None else self.codec in self.BROWSER_CODECS
+
+    def close(self):
+        """Stop the writer and remove the temporary directory, if one was made"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=2.0)
+        if self._owns_directory and self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def playlist(self):
+        """Return [(sequence, duration)] of the segments currently available"""
+        with self._lock:
+            return list(self._segments)
+
+    def segment_path(self, sequence):
+        """Return the file path of a segment, or None if it rolled off"""
+        with self._lock:
+            if not any(seq == sequence for seq, _ in self._segments):
+                return None
+        return self._path(sequence)
+
+    def _path(self, sequence, partial=False):
+        suffix = '.part.mp4' if partial else '.mp4'
+        return os.path.join(self.directory, f'seg_{sequence:06d}{suffix}')
+
+    def _open_writer(self, path, frame):
+        height, width = frame.shape[:2]
+        with Segmenter._fourcc_lock:
+            candidates = (Segmenter._fourcc,) if Segmenter._fourcc else self.FOURCC_PREFERENCE
+            for code in candidates:
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*code), self.fps, (width, height))
+                if writer.isOpened():
+                    if Segmenter._fourcc is None:
+                        Segmenter._fourcc = code
+                        if code not in self.BROWSER_CODECS:
+                            print(f"⚠️  Segmenter: no H.264 encoder, writing '{code}' "
+                                  f"segments that browsers cannot play")
+                    return writer
+                writer.release()
+        return None
+
+    def _publish(self, sequence, frames):
+        os.replace(self._path(sequence, partial=True), self._path(sequence))
+
+        with self._lock:
+            self._segments.append((sequence, frames / self.fps))
+            while len(self._segments) > self.window:
+                expired, _ = self._segments.popleft()
+                try:
+                    os.remove(self._path(expired))
+                except OSError:
+                    pass
+
+    def _run(self):
+        interval = 1.0 / self.fps
+        frames_per_segment = max(1, int(round(self.segment_seconds * self.fps)))
+        writer = None
+        frames = 0
+        sequence = 0
+        last_id = 0
+        frame = None
+        held = None
+        due = time.monotonic()
+
+        self.supervisor.subscribe()
+        try:
+            while not self._closed and time.monotonic() - self._last_request < self.idle_seconds:
+                now = time.monotonic()
+                if now < due:
+                    time.sleep(due - now)
+                    continue
+
+                # Never wait once we have a frame, a late one is simply repeated.
+                # The frame being repeated stays leased until a newer one replaces it
+                latest = self.frame_hub.next_frame(last_id, timeout=0 if frame is not None else 1.0,
+                                                   lease=True)
+                if latest is not None:
+                    self.frame_hub.release(held)
+                    held = latest[1]
+                    last_id, frame = latest[0], scale_to_height(latest[1], self.height)
+                if frame is None:
+                    due = time.monotonic()
+                    continue
+
+                if writer is None:
+                    sequence = self._next_sequence
+                    self._next_sequence += 1
+                    writer = self._open_writer(self._path(sequence, partial=True), frame)
+                    if writer is None:
+                        print("⚠️  Segmenter: no usable MP4 encoder in this OpenCV build")
+                        return
+                    frames = 0
+
+                # Repeat the newest frame when capture falls behind, so segment
+                # timing stays true to wall-clock time
+                if now - due > 1.0:
+                    due = now
+                while due <= now and frames < frames_per_segment:
+                    writer.write(frame)
+                    frames += 1
+                    due += interval
+
+                if frames >= frames_per_segment:
+                    writer.release()
+                    writer = None
+                    self._publish(sequence, frames)
+        finally:
+            self.frame_hub.release(held)
+            self.supervisor.unsubscribe()
+            if writer is not None:
+                writer.release()
+                try:
+                    os.remove(self._path(sequence, partial=True))
+                except OSError:
+                    pass
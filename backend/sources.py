@@ -0,0 +1,82 @@
+import threading
+
+from analytics import SamplingScheduler
+from capture import CameraSupervisor, FrameHub
+from framepool import FramePool
+from metrics import RollingStats
+from motion import ChangeDetector
+from portraits import PortraitExtractor
+from renditions import RenditionEncoder
+from segments import Segmenter
+
+
+def is_live_source(source):
+    """Device indexes and network streams are live; plain paths are files"""
+    return isinstance(source, int) or '://' in source
+
+
+class CameraSource:
+    """Everything that belongs to one camera: capture, frames, encoding, analytics"""
+
+    def __init__(self, config, open_capture, ladder, sampling_policy, stage_scale,
+                 portrait_cache, frame_pool_size=6, capture_options=None, segment_options=None):
+        self.config = config
+        self.camera_id = config['cameraId']
+        self.source = config['source']
+        self.is_webcam = isinstance(self.source, int)
+
+        self.frame_pool = FramePool(frame_pool_size)
+        self.frame_hub = FrameHub(self.frame_pool)
+        self.supervisor = CameraSupervisor(
+            lambda: open_capture(self.source),
+            self.frame_hub,
+            name=self.camera_id,
+            loop=not is_live_source(self.source),
+            frame_pool=self.frame_pool,
+            **(capture_options or {})
+        )
+        self.renditions = RenditionEncoder(ladder)
+        # Only recent frames count, so the QoS probe goes quiet without viewers
+        self.capture_age = RollingStats(max_age=10.0)
+        self.change_detector = ChangeDetector()
+        self.scheduler = SamplingScheduler(
+            sampling_policy,
+            scale=lambda stage: stage_scale(self.camera_id, stage),
+        )
+        self.segmenter = Segmenter(self.frame_hub, self.supervisor, **(segment_options or {}))
+        self.portraits = PortraitExtractor(portrait_cache)
+
+        # Set once models are loaded in the warmup thread
+        self.analytics = None
+        self._displayed_id = 0
+        self._display_lock = threading.Lock()
+
+    def record_display(self, frame_id, seconds):
+        """Book a frame sent to viewers as a 'display' run, once however many viewers got it"""
+        with self._display_lock:
+            if frame_id <= self._displayed_id:
+                return
+            self._displayed_id = frame_id
+        self.scheduler.record('display', seconds)
+
+    def passes_through(self, rendition):
+        """True if this camera's own JPEGs are sent unchanged at the rendition"""
+        info = self.supervisor.info
+        return (self.supervisor.passthrough_active and info is not None
+                and self.renditions.passes_through(rendition, info.height))
+
+    def rendition_inputs(self, rendition, frame_id, frame):
+        """(frame, jpeg, source height) to hand the rendition encoder
+
+        A passthrough frame stays undecoded when the camera's JPEG already
+        fits the rendition; frame and jpeg are both None if it was evicted
+        or would not decode.
+        """
+        if frame is not None:
+            return frame, None, None
+        jpeg = self.frame_hub.jpeg(frame_id)
+        info = self.supervisor.info
+        height = info.height if info is not None else None
+        if jpeg is not None and self.renditions.passes_through(rendition, height):
+            return None, jpeg, height
+        return self.frame_hub.decode(frame_id), None, None
@@ -0,0 +1,94 @@
+import time
+
+import cv2
+import numpy as np
+
+from transport import TILE_ENTRY
+
+
+class TileDiffEncoder:
+    """Send a keyframe, then only the JPEG tiles that changed since
+
+    One encoder per viewer: it keeps the picture that viewer has, compares
+    each new frame against it in tile-sized blocks in one vectorized pass,
+    and falls back to a keyframe periodically or when most tiles changed.
+    """
+
+    def __init__(self, tile_size=64, pixel_threshold=12, area_threshold=0.02,
+                 keyframe_interval=2.0, max_changed=0.5, quality=80):
+        self.tile_size = tile_size
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.keyframe_interval = keyframe_interval
+        self.max_changed = max_changed
+        self.quality = quality
+
+        self.reference = None
+        self.last_keyframe = 0.0
+        self.keyframes = 0
+        self.tile_updates = 0
+        self.tiles_sent = 0
+        self.bytes_sent = 0
+
+    def changed_tiles(self, frame):
+        """Boolean (rows, columns) mask of tiles that differ from the reference"""
+        diff = cv2.absdiff(frame, self.reference)
+        if diff.ndim == 3:
+            diff = diff.max(axis=2)
+        moved = diff > self.pixel_threshold
+
+        # Pad to whole tiles, then count moved pixels per tile in one reshape
+        t = self.tile_size
+        height, width = moved.shape
+        rows, columns = -(-height // t), -(-width // t)
+        if rows * t != height or columns * t != width:
+            moved = np.pad(moved, ((0, rows * t - height), (0, columns * t - width)))
+        counts = moved.reshape(rows, t, columns, t).sum(axis=(1, 3))
+        return counts > self.area_threshold * t * t
+
+    def encode(self, frame, now=None, keyframe=None):
+        """Return (kind, payload, metadata) for the next message, or None if nothing changed
+
+        kind is 'keyframe' (a full JPEG) or 'tiles' (TILE_ENTRY + JPEG pairs).
+        keyframe() may return an already encoded JPEG of the frame to reuse.
+        """
+        now = time.monotonic() if now is None else now
+
+        mask = None
+        if (self.reference is not None and self.reference.shape == frame.shape
+                and now - self.last_keyframe < self.keyframe_interval):
+            mask = self.changed_tiles(frame)
+            if not mask.any():
+                return None
+
+        if mask is None or mask.mean() > self.max_changed:
+            jpeg = keyframe() if keyframe is not None else None
+            if jpeg is None:
+                ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if not ret:
+                    return None
+            self.reference = frame.copy()
+            self.last_keyframe = now
+            self.keyframes += 1
+            self.bytes_sent += len(jpeg)
+            return 'keyframe', jpeg, {'width': frame.shape[1], 'height': frame.shape[0]}
+
+        t = self.tile_size
+        parts = []
+        rows, columns = np.nonzero(mask)
+        for row, column in zip(rows.tolist(), columns.tolist()):
+            y0, x0 = row * t, column * t
+            tile = frame[y0:y0 + t, x0:x0 + t]
+            ret, jpeg = cv2.imencode('.jpg', tile, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ret:
+                continue
+            parts.append(TILE_ENTRY.pack(column, row, len(jpeg)))
+            parts.append(memoryview(jpeg))
+            # The viewer now has this tile, compare the next frame against it
+            self.reference[y0:y0 + t, x0:x0 + t] = tile
+
+        payload = b''.join(parts)
+        self.tile_updates += 1
+        self.tiles_sent += len(parts) // 2
+        self.bytes_sent += len(payload)
+        return 'tiles', payload, {'tileSize': t, 'tiles': len(parts) // 2}
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import struct
+import time
+
+
+FRAME_MAGIC = b'INTV'
+FRAME_VERSION = 2
+MESSAGE_FRAME = 1
+# Payload is a list of (TILE_ENTRY, JPEG) pairs to paint over the last frame
+MESSAGE_TILES = 2
+
+# magic, version, message type, channel id, rendition id, sequence number,
+# capture time and send time (epoch ms), JPEG length, metadata JSON length;
+# big endian. The JPEG and then the metadata follow the header
+FRAME_HEADER = struct.Struct('>4sBBBBIqqII')
+# column, row, JPEG length of one tile in a MESSAGE_TILES payload
+TILE_ENTRY = struct.Struct('>HHI')
+
+
+def wall_clock_ms(monotonic_at):
+    """Epoch milliseconds of a time.monotonic() timestamp"""
+    return int((time.time() - (time.monotonic() - monotonic_at)) * 1000)
+
+
+def pack_frame(channel_id, rendition_id, seq, captured_at_ms, jpeg, metadata=None,
+               message_type=MESSAGE_FRAME):
+    """One binary WebSocket message: fixed header, JPEG, optional metadata JSON"""
+    meta = json.dumps(metadata, separators=(',', ':')).encode() if metadata else b''
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC, FRAME_VERSION, message_type, channel_id, rendition_id, seq & 0xFFFFFFFF,
+        captured_at_ms, int(time.time() * 1000), len(jpeg), len(meta),
+    )
+    return b''.join((header, jpeg, meta))
+
+
+def frame_layout():
+    """Describe the binary layout for the text hello message"""
+    return {
+        'byteOrder': 'big',
+        'headerBytes': FRAME_HEADER.size,
+        'fields': [
+            ['magic', '4s'], ['version', 'u8'], ['type', 'u8'], ['channel', 'u8'], ['rendition', 'u8'],
+            ['seq', 'u32'], ['capturedAt', 'i64'], ['sentAt', 'i64'],
+            ['jpegBytes', 'u32'], ['metadataBytes', 'u32'],
+        ],
+        'types': {'frame': MESSAGE_FRAME, 'tiles': MESSAGE_TILES},
+        'tileEntry': [['column', 'u16'], ['row', 'u16'], ['jpegBytes', 'u32']],
+    }
+
+
+def json_delta(previous, current):
+    """Keys of current that differ from previous, recursing into dicts
+
+    Removed keys map to None; lists are replaced whole.
+    """
+    delta = {}
+    for key, value in current.items():
+        old = previous.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = json_delta(old, value)
+            if nested:
+                delta[key] = nested
+        elif value != old or key not in previous:
+            delta[key] = value
+    for key in previous:
+        if key not in current:
+            delta[key] = None
+    return delta
+
+
+class CreditWindow:
+    """Send credits granted by the client, one per frame
+
+    The server only sends while it holds credits, so it never gets further
+    ahead of the client than the client allows and nothing queues up in
+    socket buffers; frames that arrive meanwhile are simply skipped.
+    """
+
+    def __init__(self, max_credits=8):
+        self.max_credits = max_credits
+        self.credits = 0
+        self.closed = False
+        self._available = asyncio.Event()
+
+    def grant(self, count):
+        self.credits = max(0, min(self.max_credits, self.credits + int(count)))
+        if self.credits > 0:
+            self._available.set()
+
+    def close(self):
+        """Wake up a waiting sender for good, e.g. when the client is gone"""
+        self.closed = True
+        self._available.set()
+
+    async def acquire(self):
+        """Wait for a credit and spend it; False once the window is closed"""
+        while self.credits <= 0 and not self.closed:
+            self._available.clear()
+            await self._available.wait()
+        if self.closed:
+            return False
+        self.credits -= 1
+        return True
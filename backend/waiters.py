@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+
+class AsyncWaiters:
+    """Wake coroutines waiting on a producer thread without parking worker threads
+
+    Each waiting coroutine registers an asyncio.Event of its own loop; the
+    producer thread sets it with call_soon_threadsafe after changing state.
+    """
+
+    def __init__(self):
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    def notify_all(self):
+        """Called by the producer after its state changed"""
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The waiter's loop is closed already
+                pass
+
+    async def wait_for(self, predicate, timeout):
+        """Wait until predicate() is true; False if the timeout passed first"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            deadline = loop.time() + timeout
+            while not predicate():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), remaining)
+                except asyncio.TimeoutError:
+                    return False
+                waiter[1].clear()
+            return True
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)